@@ -6,7 +6,7 @@ project_root = os.path.abspath("src")
 
 datas = []
 binaries = []
-hiddenimports = ['aikeyboard', 'aikeyboard.speech', 'aikeyboard.model_cache']
+hiddenimports = ['aikeyboard', 'aikeyboard.speech', 'aikeyboard.model_cache', 'aikeyboard.model_pool']
 tmp_ret = collect_all('vosk')
 datas += tmp_ret[0]; binaries += tmp_ret[1]; hiddenimports += tmp_ret[2]
 
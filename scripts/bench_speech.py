@@ -0,0 +1,171 @@
+"""Replay benchmark for the SpeechWorker hot loop.
+
+Captures from device_manager's FileBackend instead of a microphone and drives
+SpeechWorker.start_listening() faster than real time over a corpus of
+recorded WAV files (any rate: 16, 44.1 and 48 kHz are all resampled the
+same way as a live microphone). Flight recordings dumped from the tray
+(.npz) can be dropped into the corpus as regression fixtures.
+
+    python scripts/bench_speech.py corpus/ --write-baseline scripts/bench_baseline.json
+    python scripts/bench_speech.py corpus/ --baseline scripts/bench_baseline.json
+
+With --baseline the run fails (exit code 1) if real-time factor, CPU per
+audio second or peak RSS regress by more than --tolerance.
+
+Partial results are not rate limited during replay (the wall-clock throttle
+would make their number depend on how fast the machine is) and are
+reported per audio second.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+os.environ.setdefault("AIKEYBOARD_CAPTURE", "synthetic")  # no audio hardware needed, files are set per run
+
+from aikeyboard.audio_io import AUDIO_SUFFIXES  # noqa: E402
+from aikeyboard.device_manager import FileBackend, device_manager  # noqa: E402
+from aikeyboard.latency import latency_stats  # noqa: E402
+from aikeyboard.model_cache import model_cache  # noqa: E402
+from aikeyboard.model_pool import model_pool  # noqa: E402
+from aikeyboard.speech import SpeechWorker  # noqa: E402
+
+TRAILING_SILENCE = 2.0     # seconds appended so the last utterance gets flushed
+
+
+def run_file(path: Path, model_name: Optional[str] = None) -> Dict:
+    worker = SpeechWorker(device_index=0, model_name=model_name, partial_interval=0.0)
+    # Pushed as fast as the decoder drains the capture ring (back-pressure instead of overruns)
+    backend = FileBackend(path, realtime=False, trailing_silence=TRAILING_SILENCE, on_eof=worker.stop_listening)
+    device_manager.set_backend(backend)
+    rate, duration = backend.rate, backend.duration
+    partials: List[str] = []
+    finals: List[str] = []
+    final_latencies: List[float] = []
+
+    def on_recognized(text):
+        finals.append(text)
+        if worker.emitted_at:
+            emitted, captured = worker.emitted_at.popleft()
+            final_latencies.append(emitted - captured)
+
+    worker.partial_result.connect(partials.append)
+    worker.recognized.connect(on_recognized)
+    errors: List[str] = []
+    worker.error.connect(errors.append)
+
+    wall0, cpu0 = time.perf_counter(), time.process_time()
+    worker.start_listening()
+    wall, cpu = time.perf_counter() - wall0, time.process_time() - cpu0
+    if errors:
+        raise RuntimeError(f"{path}: {errors[0]}")
+    return {
+        "file": str(path),
+        "rate": rate,
+        "audio_s": duration,
+        "wall_s": wall,
+        "cpu_s": cpu,
+        "rtf": wall / duration,
+        "cpu_per_audio_s": cpu / duration,
+        "partials": len(partials),
+        "partials_per_audio_s": len(partials) / duration,
+        "finals": len(finals),
+        "final_latency_ms": [round(v * 1000, 2) for v in final_latencies],
+        "overruns": worker.overruns,
+        "text": " ".join(finals),
+    }
+
+
+def peak_rss_mb() -> float:
+    try:
+        import resource
+    except ImportError:     # Windows
+        return 0.0
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / 1024 ** 2 if sys.platform == "darwin" else rss / 1024
+
+
+def summarize(results: List[Dict]) -> Dict:
+    audio = sum(r["audio_s"] for r in results)
+    latencies = sorted(v for r in results for v in r["final_latency_ms"])
+    summary = {
+        "files": len(results),
+        "audio_s": audio,
+        "rtf": sum(r["wall_s"] for r in results) / audio,
+        "cpu_per_audio_s": sum(r["cpu_s"] for r in results) / audio,
+        "partials": sum(r["partials"] for r in results),
+        "partials_per_audio_s": sum(r["partials"] for r in results) / audio,
+        "finals": sum(r["finals"] for r in results),
+        "final_latency_p50_ms": latencies[len(latencies) // 2] if latencies else 0.0,
+        "final_latency_max_ms": latencies[-1] if latencies else 0.0,
+        "peak_rss_mb": peak_rss_mb(),
+        "by_rate": {},
+    }
+    for rate in sorted({r["rate"] for r in results}):
+        subset = [r for r in results if r["rate"] == rate]
+        sub_audio = sum(r["audio_s"] for r in subset)
+        summary["by_rate"][str(rate)] = {
+            "rtf": sum(r["wall_s"] for r in subset) / sub_audio,
+            "cpu_per_audio_s": sum(r["cpu_s"] for r in subset) / sub_audio,
+        }
+    summary["stages"] = latency_stats.to_dict()["stages"]
+    return summary
+
+
+def compare(summary: Dict, baseline: Dict, tolerance: float) -> List[str]:
+    regressions = []
+    for key in ("rtf", "cpu_per_audio_s", "peak_rss_mb", "final_latency_p50_ms"):
+        old, new = baseline.get(key), summary[key]
+        if old and new > old * (1 + tolerance):
+            regressions.append(f"{key}: {new:.4g} vs baseline {old:.4g} (+{(new / old - 1) * 100:.1f}%)")
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Replay recorded audio through SpeechWorker")
+    parser.add_argument("corpus", type=Path, help="directory of WAV/FLAC/.npz files")
+    parser.add_argument("-m", "--model", help="model name (default: the configured one)")
+    parser.add_argument("--baseline", type=Path, help="fail if results regress against this file")
+    parser.add_argument("--write-baseline", type=Path, help="store the summary as new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="allowed regression (default 10%%)")
+    parser.add_argument("--json", type=Path, help="write per-file results and summary here")
+    args = parser.parse_args(argv)
+
+    files = sorted(p for p in args.corpus.rglob("*") if p.suffix.lower() in AUDIO_SUFFIXES)
+    if not files:
+        print(f"No audio files in {args.corpus}", file=sys.stderr)
+        return 2
+
+    # Model load and warm-up are not part of the measurement
+    model_path = model_cache.ensure_model(args.model)
+    model_pool.preload(model_path)
+    latency_stats.reset()
+
+    results = []
+    for path in files:
+        result = run_file(path, args.model)
+        results.append(result)
+        print(f"{path.name:40s} {result['rate']:6d} Hz  rtf {result['rtf']:.3f}  "
+              f"cpu/s {result['cpu_per_audio_s']:.3f}  partials/s {result['partials_per_audio_s']:5.2f}  "
+              f"finals {result['finals']:3d}")
+
+    summary = summarize(results)
+    print(json.dumps({k: v for k, v in summary.items() if k != "stages"}, indent=2))
+    if args.json:
+        args.json.write_text(json.dumps({"summary": summary, "files": results}, indent=2, ensure_ascii=False))
+    if args.write_baseline:
+        args.write_baseline.write_text(json.dumps(summary, indent=2))
+    if args.baseline:
+        regressions = compare(summary, json.loads(args.baseline.read_text()), args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -26,4 +26,9 @@ setup(
     cmdclass={
         'build_py': build_py,
     },
+    entry_points={
+        'console_scripts': [
+            'aikeyboard-batch = aikeyboard.batch:main',
+        ],
+    },
 )
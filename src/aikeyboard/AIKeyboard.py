@@ -1,17 +1,22 @@
 # src/aikeyboard/AIKeyboard.py
 import logging
+import multiprocessing
 import sys
+import time
 from typing import Optional
 
-from PySide6.QtCore import QCoreApplication, QLocale, QTimer, QTranslator, Slot
+from PySide6.QtCore import QCoreApplication, QLocale, QThread, QTimer, QTranslator, Slot
 from PySide6.QtGui import QAction, QColorConstants, QIcon, QPainter
 from PySide6.QtWidgets import QApplication, QMenu, QSystemTrayIcon
 
 from aikeyboard import resources  # noqa: F401
 from aikeyboard.config import app_config
 from aikeyboard.device_manager import device_manager
+from aikeyboard.latency import latency_stats
+from aikeyboard.model_pool import model_pool
 from aikeyboard.platform_adapter import platform_adapter
-from aikeyboard.speech import SpeechRecognizer, SpeechWorker
+from aikeyboard.speech import ModelPreloader, SpeechRecognizer, SpeechWorker
+from aikeyboard.tracing import tracer
 
 logging.basicConfig(level=logging.DEBUG)
 
@@ -29,7 +34,6 @@ class AIKeyboardApp(QSystemTrayIcon):
     VERSION_ICONS = {
         "small": "🔹", "spk": "🔸", "big-lgraph": "💠", "big": "🧊"
     }
-
     def __init__(self):
         super().__init__()
         self.device = None
@@ -39,8 +43,16 @@ class AIKeyboardApp(QSystemTrayIcon):
         logging.debug('AIKeyboard.__init__(): menu initialization complete')
         self.setContextMenu(self.menu)
         self.is_listening = False
+        self.model_ready = False
+        self._preload_thread: Optional[QThread] = None
+        self._preloader: Optional[ModelPreloader] = None
+        self._preload_again = False
         self._current_worker: Optional[SpeechWorker] = None
+        self._last_written = ""
         self.activated.connect(self._toggle_listening)
+        app_config.modelChanged.connect(self._on_model_changed)
+        from aikeyboard.model_cache import model_cache
+        model_cache.modelsChanged.connect(self._on_models_changed)
 
         self._init_icon()
         self._init_i18n()
@@ -64,6 +76,8 @@ class AIKeyboardApp(QSystemTrayIcon):
         # Create state icons
         self.state_icons = {
             'uninitialized': self._create_state_icon(QColorConstants.Svg.orangered),
+            'loading': self._create_state_icon(QColorConstants.Svg.orange),
+            'ready': self._create_state_icon(QColorConstants.Transparent),
             'idle': self._create_state_icon(QColorConstants.Transparent),
             'listening': self._create_state_icon(QColorConstants.Svg.green),
             'processing': self._create_state_icon(QColorConstants.Svg.yellow)
@@ -84,8 +98,20 @@ class AIKeyboardApp(QSystemTrayIcon):
             action.triggered.connect(lambda _, n=name: self._on_device_selected(n))
             self.device_menu.addAction(action)
         
-        menu.addMenu(self._create_model_menu())
+        self.model_menu = self._create_model_menu()
+        self.model_menu_action = menu.addMenu(self.model_menu)
+
+        self.command_action = menu.addAction(self.tr("Command mode"))
+        self.command_action.setCheckable(True)
+        self.command_action.toggled.connect(self._on_command_mode_toggled)
 
+        menu.addSeparator()
+        menu.addAction(self.tr("Save last 30 seconds of audio"), self._dump_flight_recording)
+        menu.addAction(self.tr("Save latency statistics"), self._dump_latency)
+        trace_action = menu.addAction(self.tr("Record timeline trace"))
+        trace_action.setCheckable(True)
+        trace_action.setChecked(tracer.enabled)
+        trace_action.toggled.connect(self._on_trace_toggled)
         menu.addSeparator()
         menu.addAction(self.tr("Quit"), QCoreApplication.quit)
         return menu
@@ -94,11 +120,20 @@ class AIKeyboardApp(QSystemTrayIcon):
         try:
             from aikeyboard.model_cache import model_cache
             langs = model_cache.get_languages()
+            installed = {m.name: m for m in model_cache.installed_models(measure=False)}
         except Exception as e:
             print(f"Failed to fetch model list: {e}")
             return QMenu(self.tr("Select Model (unavailable)"))
 
         model_menu = QMenu(self.tr("Select Model"))
+        usage = self._format_bytes(sum(m.disk_bytes or 0 for m in installed.values()))
+        quota = model_cache.quota_bytes()
+        usage_text = self.tr("Disk usage: %1").replace('%1', usage)
+        if quota:
+            usage_text = (self.tr("Disk usage: %1 of %2")
+                          .replace('%1', usage).replace('%2', self._format_bytes(quota)))
+        model_menu.addAction(usage_text).setEnabled(False)
+        model_menu.addSeparator()
 
         for lang in langs:
             flag = self.LANG_FLAGS.get(lang, "🏳")
@@ -109,6 +144,9 @@ class AIKeyboardApp(QSystemTrayIcon):
                     size = model.size
                     icon = self.VERSION_ICONS.get(size, "📦")
                     label = f'{icon} {model.name}'
+                    if model.name in installed:
+                        disk_bytes = installed[model.name].disk_bytes
+                        label += f'  💾 {self._format_bytes(disk_bytes)}' if disk_bytes is not None else '  💾'
                     action = QAction(label, sub)
                     action.triggered.connect(lambda _, m=model.name: self._on_model_selected(m))
                     sub.addAction(action)
@@ -187,7 +225,7 @@ class AIKeyboardApp(QSystemTrayIcon):
         self.setIcon(self.state_icons.get(state, self.state_icons['idle']))
         self.setToolTip(self.tr("AI Keyboard (%1)").replace('%1', state.capitalize()))
         logging.debug(f'update_state({state}):')
-        if state != "uninitialized" and not hasattr(self, '_popped'):
+        if state not in ("uninitialized", "loading") and not hasattr(self, '_popped'):
             self.show_notification(self.tr('Speech recognition is now active.'))
             self._popped = True
 
@@ -201,7 +239,48 @@ class AIKeyboardApp(QSystemTrayIcon):
         logging.debug(f'AIKeyboard._load_config(): device is "{device}"')
         if device is not None:
             self._on_device_selected(device)
-            
+        model_pool.budget_bytes = app_config.model_memory_mb * 1024 * 1024
+        self._start_preload()
+
+    def _start_preload(self):
+        """Load and warm up the configured model in the background"""
+        if self._preload_thread:
+            self._preload_again = True
+            return
+        self.model_ready = False
+        if self.device and not self.is_listening:
+            self.update_state('loading')
+        self._preloader = ModelPreloader()
+        self._preload_thread = QThread()
+        self._preloader.moveToThread(self._preload_thread)
+
+        self._preload_thread.started.connect(self._preloader.run)
+        self._preloader.loaded.connect(self._on_model_loaded)
+        self._preloader.error.connect(self._on_speech_error)
+        self._preloader.finished.connect(self._preload_thread.quit)
+        self._preload_thread.finished.connect(self._preloader.deleteLater)
+        self._preload_thread.finished.connect(self._preload_thread.deleteLater)
+        self._preload_thread.finished.connect(self._on_preload_finished)
+        self._preload_thread.start()
+
+    def _on_preload_finished(self):
+        self._preload_thread = None
+        self._preloader = None
+        if self._preload_again:
+            self._preload_again = False
+            self._start_preload()
+        elif not self.model_ready and self.device and not self.is_listening:
+            self.update_state('idle')  # failed, the worker will retry on first use
+
+    def _on_model_loaded(self, model_path):
+        logging.info(f'Model ready: {model_path}')
+        self.model_ready = True
+        if self.speech:
+            # Hot swap: the running worker changes recognizer between utterances
+            self.speech.swap_model(model_path)
+        if self.device and not self.is_listening:
+            self.update_state('ready')
+
     def _on_device_selected(self, name):
         logging.info(f"Selected audio device: {name}")
         app_config.audio_device = name
@@ -213,14 +292,21 @@ class AIKeyboardApp(QSystemTrayIcon):
             return
 
         # Update UI
-        self.update_state('idle')
+        self.update_state('ready' if self.model_ready else 'loading')
         self.device_info.setText(self.tr("Using: %1").replace('%1', name))
         self.device = name
 
         # Reinitialize speech
         if self.speech:
             self.speech.stop()
-        self.speech = SpeechRecognizer(device_index=index)
+        self.speech = SpeechRecognizer(device_index=index,
+                                       partial_interval=app_config.partial_interval_ms / 1000,
+                                       languages=app_config.languages,
+                                       out_of_process=app_config.decoder_process,
+                                       min_block=app_config.min_block_ms / 1000,
+                                       max_block=app_config.max_block_ms / 1000,
+                                       commands=list(app_config.commands))
+        self.speech.set_command_mode(self.command_action.isChecked())
         if self.speech:
             # Connect new speech instance
             self.state_connections.append(
@@ -231,6 +317,28 @@ class AIKeyboardApp(QSystemTrayIcon):
         print(f"Selected Vosk model: {model_name}")
         app_config.model = model_name # type: ignore
 
+    @staticmethod
+    def _format_bytes(n: int) -> str:
+        for unit in ("B", "KB", "MB"):
+            if n < 1024:
+                return f"{n:.0f} {unit}"
+            n /= 1024
+        return f"{n:.1f} GB"
+
+    @Slot()
+    def _on_models_changed(self):
+        # New catalog, or models downloaded/evicted: swap the submenu in place
+        model_menu = self._create_model_menu()
+        old_action = self.model_menu_action
+        self.model_menu_action = self.menu.insertMenu(old_action, model_menu)
+        self.menu.removeAction(old_action)
+        self.model_menu.deleteLater()
+        self.model_menu = model_menu
+
+    def _on_model_changed(self, model_name: str):
+        logging.info(f'Model changed to {model_name}, loading in background')
+        self._start_preload()
+
     def _connect_worker_signals(self, worker):
         """Minimal working version with proper disconnections"""
         # Disconnect previous
@@ -251,13 +359,33 @@ class AIKeyboardApp(QSystemTrayIcon):
                 self._current_worker.error.disconnect()
             except:  # noqa: E722
                 pass
+            try:
+                self._current_worker.flight_recording_saved.disconnect()
+            except:  # noqa: E722
+                pass
+            try:
+                self._current_worker.command.disconnect()
+            except:  # noqa: E722
+                pass
+            try:
+                self._current_worker.finished.disconnect(self._on_worker_finished)
+            except:  # noqa: E722
+                pass
         
         # Connect new
         self._current_worker = worker
         worker.state_changed.connect(self._handle_state_change)
         worker.recognized.connect(self._on_speech_recognized)
         worker.partial_result.connect(self._on_partial_result)
-        worker.error.connect(self._on_speech_error)        
+        worker.error.connect(self._on_speech_error)
+        worker.flight_recording_saved.connect(self._on_flight_recording_saved)
+        worker.command.connect(self._on_speech_command)
+        worker.finished.connect(self._on_worker_finished)
+
+    @Slot()
+    def _on_worker_finished(self):
+        # The worker and its thread are deleted once the loop has ended
+        self._current_worker = None
 
     def _handle_state_change(self, state):
         """Update UI based on state"""
@@ -274,10 +402,89 @@ class AIKeyboardApp(QSystemTrayIcon):
         
     def _on_speech_recognized(self, text):
         logging.info(f"Recognized: {text}")
-        platform_adapter.write(text + " ")  # Add space after each phrase
+        received = time.monotonic()
+        captured_at = None
+        if self._current_worker and self._current_worker.emitted_at:
+            emitted, captured_at = self._current_worker.emitted_at.popleft()
+            latency_stats.record("signal_hop", received - emitted)
+        self._last_written = text + " "  # Add space after each phrase
+        with tracer.span("inject"):
+            platform_adapter.write(self._last_written)
+        done = time.monotonic()
+        latency_stats.record("inject", done - received)
+        if captured_at:
+            latency_stats.record("end_to_end", done - captured_at)
+
+    def _on_command_mode_toggled(self, enabled):
+        logging.info(f"Command mode {'on' if enabled else 'off'}")
+        if self.speech:
+            self.speech.set_command_mode(enabled)
+
+    def _on_speech_command(self, text):
+        logging.info(f"Command: {text}")
+        with tracer.span("command"):
+            self._run_command(text)
+
+    def _run_command(self, text):
+        action = app_config.commands.get(text, "")
+        kind, _, arg = action.partition(":")
+        if kind == "undo":
+            platform_adapter.press_key("BackSpace", len(self._last_written))
+            self._last_written = ""
+        elif kind == "key":
+            platform_adapter.press_key(arg)
+            self._last_written = ""
+        elif kind == "text":
+            # Punctuation sticks to the previous word
+            if self._last_written.endswith(" "):
+                platform_adapter.press_key("BackSpace")
+            self._last_written = arg + " "
+            platform_adapter.write(self._last_written)
+        else:
+            logging.warning(f"Command {text!r} has no valid action: {action!r}")
+
+    def _dump_flight_recording(self):
+        from aikeyboard.model_cache import model_cache
+        folder = model_cache.cache_dir.parent / "recordings"
+        path = folder / time.strftime("flight-%Y%m%d-%H%M%S.npz")
+        folder.mkdir(parents=True, exist_ok=True)
+        try:
+            requested = self._current_worker is not None and self._current_worker.request_flight_dump(str(path))
+        except RuntimeError:    # worker deleted before _on_worker_finished() ran
+            requested = False
+        if not requested:
+            self.show_notification(self.tr("Not recording"))
+
+    def _on_flight_recording_saved(self, path):
+        self.show_notification(self.tr("Audio saved to %1").replace('%1', path))
+
+    def _on_trace_toggled(self, enabled):
+        """Start a fresh trace, or stop and save the one being recorded"""
+        if enabled:
+            tracer.clear()
+            tracer.set_enabled(True)
+            return
+        tracer.set_enabled(False)
+        from aikeyboard.model_cache import model_cache
+        folder = model_cache.cache_dir.parent / "traces"
+        try:
+            folder.mkdir(parents=True, exist_ok=True)
+            path = tracer.export(folder / time.strftime("trace-%Y%m%d-%H%M%S.json"))
+            self.show_notification(self.tr("Trace saved to %1").replace('%1', path))
+        except OSError as e:
+            self._on_speech_error(str(e))
+
+    def _dump_latency(self):
+        from aikeyboard.model_cache import model_cache
+        path = model_cache.cache_dir.parent / time.strftime("latency-%Y%m%d-%H%M%S.json")
+        try:
+            self.show_notification(self.tr("Latency statistics saved to %1").replace('%1', latency_stats.dump(path)))
+        except OSError as e:
+            self._on_speech_error(str(e))
 
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()  # decoder processes in frozen builds
     app = QApplication(sys.argv)
     platform_adapter.set_font(app)
     aik = AIKeyboardApp()
@@ -0,0 +1,38 @@
+# src/aikeyboard/audio_io.py
+"""Reading recorded audio: WAV, FLAC and flight recorder (.npz) files."""
+import wave
+from pathlib import Path
+from typing import Tuple
+
+import numpy as np
+
+AUDIO_SUFFIXES = {".wav", ".flac", ".npz"}
+
+
+def read_audio(path: Path) -> Tuple[np.ndarray, int]:
+    """Mono int16 samples and sample rate of a WAV, FLAC or flight recorder file."""
+    if path.suffix.lower() == ".npz":
+        with np.load(str(path)) as recording:
+            return recording["audio"], int(recording["sample_rate"])
+    if path.suffix.lower() == ".flac":
+        try:
+            import soundfile
+        except ImportError:
+            raise RuntimeError("FLAC input needs the 'soundfile' package")
+        samples, rate = soundfile.read(str(path), dtype="int16", always_2d=True)
+        return np.ascontiguousarray(samples.mean(axis=1).astype(np.int16)), rate
+
+    with wave.open(str(path), "rb") as wf:
+        width, channels, rate = wf.getsampwidth(), wf.getnchannels(), wf.getframerate()
+        raw = wf.readframes(wf.getnframes())
+    if width == 2:
+        samples = np.frombuffer(raw, dtype=np.int16)
+    elif width == 1:
+        samples = ((np.frombuffer(raw, dtype=np.uint8).astype(np.int16) - 128) << 8).astype(np.int16)
+    elif width == 4:
+        samples = (np.frombuffer(raw, dtype=np.int32) >> 16).astype(np.int16)
+    else:
+        raise RuntimeError(f"Unsupported sample width {width * 8} bits")
+    if channels > 1:
+        samples = samples.reshape(-1, channels).mean(axis=1).astype(np.int16)
+    return samples, rate
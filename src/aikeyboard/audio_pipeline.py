@@ -9,47 +9,56 @@ import json
 import time
 
 import numpy as np
-import sounddevice as sd
-from PySide6.QtCore import QObject, QThread, Signal, Slot
+from PySide6.QtCore import SIGNAL, QObject, QThread, Signal, Slot
 from vosk import KaldiRecognizer, Model
 
+from aikeyboard.device_manager import device_manager
+from aikeyboard.tracing import tracer
+from aikeyboard.vad import P2Quantile, block_dbfs
+
 VOSK_MODEL = "vosk-model-small-it-0.22"
 
 
 class SilenceDetector:
-    def __init__(self, calibration_duration=2.0, sample_rate=16000, margin_db=3.0):
+    # Runs in the PortAudio callback: no per-block allocations and no printing
+    def __init__(self, calibration_duration=2.0, sample_rate=16000, margin_db=3.0,
+                 floor_quantile=0.2, tracking_step_db=0.5):
         self.calibration_duration = calibration_duration
         self.sample_rate = sample_rate
         self.margin_db = margin_db
-        self.calibration_buffer = []
+        self.floor_quantile = floor_quantile        # share of blocks expected below the floor
+        self.tracking_step_db = tracking_step_db    # largest floor move per block after calibration
+        self.calibration_quantile = P2Quantile(0.5)
         self.calibrated = False
         self.noise_floor_db = -40.0
+        self.current_db = -100.0
         self.start_time = time.monotonic()
+        self._scratch = np.empty(int(sample_rate * 0.5), dtype=np.float32)
 
-    def _dbfs(self, float_data: np.ndarray) -> float:
-        rms = np.sqrt(np.mean(float_data ** 2))
-        return 20 * np.log10(rms + 1e-10)
+    def _dbfs(self, samples: np.ndarray) -> float:
+        if len(samples) > len(self._scratch):
+            self._scratch = np.empty(len(samples), dtype=np.float32)
+        return block_dbfs(samples, self._scratch)
 
     def is_silence(self, indata: np.ndarray) -> bool:
-        # normalize int16 → float32 in -1.0 ... +1.0
-        audio_data = np.squeeze(indata).astype(np.float32) / 32768.0
-
-        now = time.monotonic()
+        # (frames, 1) int16 block from sounddevice; reshape is a view
+        current_db = self.current_db = self._dbfs(indata.reshape(-1))
 
         if not self.calibrated:
-            self.calibration_buffer.append(audio_data)
-            if now - self.start_time >= self.calibration_duration:
-                rms_values = [np.sqrt(np.mean(chunk ** 2)) for chunk in self.calibration_buffer]
-                rms_median = np.median(rms_values)
-                self.noise_floor_db = 20 * np.log10(rms_median + 1e-10)
+            self.calibration_quantile.add(current_db)
+            if time.monotonic() - self.start_time >= self.calibration_duration:
+                self.noise_floor_db = self.calibration_quantile.value
                 self.calibrated = True
-                print(f"[Calibration] Noise floor estimated at {self.noise_floor_db:.1f} dBFS")
             return True  # assume silence during calibration
 
+        # Keep following the floor: stochastic approximation of its quantile
+        if current_db < self.noise_floor_db:
+            self.noise_floor_db -= self.tracking_step_db * (1.0 - self.floor_quantile)
+        else:
+            self.noise_floor_db += self.tracking_step_db * self.floor_quantile
+
         # Check current block against noise floor
-        current_db = self._dbfs(audio_data)
         silence_threshold = max(self.noise_floor_db + self.margin_db, -40.0)
-        print(f'is_silence(): current_db({current_db}) < silence_threshold({silence_threshold})', end='\r')
         return current_db < silence_threshold
 
 
@@ -60,9 +69,13 @@ class AudioCaptureWorker(QObject):
     BLOCK_SIZE = int(SAMPLE_RATE * BLOCK_DURATION)  # 3200
     SILENCE_THRESHOLD = 900000                      # Energy threshold
     MAX_SILENCE_BLOCKS = int(1.0 / BLOCK_DURATION)  # 1s silence
+    MAX_UTTERANCE_DURATION = 15.0                   # longer utterances are flushed anyway
+    UTTERANCE_BUFFERS = 3                           # utterances that may be in flight to the Transcriber
 
     audio_data = Signal(bytes)                      # emitted but not connected
-    audio_chunk = Signal(np.ndarray)
+    audio_chunk = Signal(np.ndarray)                # read-only view, valid until UTTERANCE_BUFFERS more are sent
+    audio_block = Signal(np.ndarray)                # the same, one captured block at a time
+    utterance_end = Signal()                        # after the last audio_block of an utterance
     error_occurred = Signal(str)
 
     def __init__(self, device=None, samplerate=SAMPLE_RATE, blocksize=BLOCK_SIZE):
@@ -72,7 +85,12 @@ class AudioCaptureWorker(QObject):
         self.blocksize = blocksize
         self.running = False
         self.stream = None
-        self._buffer = []
+        # Preallocated utterance buffers, used in rotation so a chunk being
+        # transcribed is not overwritten by the next one
+        self._utterances = np.zeros((self.UTTERANCE_BUFFERS, int(samplerate * self.MAX_UTTERANCE_DURATION)),
+                                    dtype=np.int16)
+        self._current = 0
+        self._filled = 0
         self._silence_blocks = 0
         self._sent_chunks = 0
         self.received_chunks = 0
@@ -80,46 +98,66 @@ class AudioCaptureWorker(QObject):
 
     def start(self):
         try:
-            self.stream = sd.InputStream(
-                samplerate=self.samplerate,
-                blocksize=self.blocksize,
-                dtype='int16',
-                channels=1,
-                callback=self._callback,
-                device=self.device
+            self.stream = device_manager.open_stream(
+                self.samplerate,
+                device_manager.find_device(self.device),
+                self.blocksize,
+                sink=lambda samples: self._callback(samples, len(samples), None, None)
             )
-            self.stream.start()
             self.running = True
         except Exception as e:
             self.error_occurred.emit(e)
 
     def _callback(self, indata, _frames, _time, _status):
         if self.running:
-            self.audio_data.emit(bytes(indata))     # unused
+            if self.receivers(SIGNAL("audio_data(PyObject)")):
+                self.audio_data.emit(bytes(indata))     # unused
             
             if not self.silence_detector.calibrated:
                self.silence_detector.is_silence(indata)
-               print(f'_callback(): {time.monotonic() - self.silence_detector.start_time} >= {self.silence_detector.calibration_duration}', end='\r')
                return 
             
             if self.silence_detector.is_silence(indata):
-                self._buffer.append(np.squeeze(indata.copy()))
+                self._append(indata)
                 self._silence_blocks = 0
-            elif self._buffer:
+            elif self._filled:
                 self._silence_blocks += 1
                 if self._silence_blocks > self.MAX_SILENCE_BLOCKS:
-                    chunk = np.concatenate(self._buffer)
-                    self.audio_chunk.emit(chunk)
-                    self._buffer.clear()
+                    self._flush()
                     self._silence_blocks = 0
-                    self._sent_chunks += 1
                 else:
-                    self._buffer.append(np.squeeze(indata.copy()))
+                    self._append(indata)
+
+    def _append(self, indata):
+        samples = indata.reshape(-1)
+        while len(samples):
+            buffer = self._utterances[self._current]
+            n = min(len(samples), len(buffer) - self._filled)
+            buffer[self._filled:self._filled + n] = samples[:n]
+            self._filled += n
+            if self.receivers(SIGNAL("audio_block(PyObject)")):
+                block = buffer[self._filled - n:self._filled]
+                block.flags.writeable = False
+                self.audio_block.emit(block)
+            samples = samples[n:]
+            if self._filled == len(buffer):
+                self._flush()   # MAX_UTTERANCE_DURATION reached
+
+    def _flush(self):
+        chunk = self._utterances[self._current, :self._filled]
+        chunk.flags.writeable = False
+        self._current = (self._current + 1) % self.UTTERANCE_BUFFERS
+        self._filled = 0
+        if self.receivers(SIGNAL("audio_chunk(PyObject)")):
+            self.audio_chunk.emit(chunk)
+            self._sent_chunks += 1
+        if self.receivers(SIGNAL("utterance_end()")):
+            self.utterance_end.emit()
 
     def stop(self):
         self.running = False
         if self.stream:
-            self.stream.stop()
+            self.stream.stop_stream()
             self.stream.close()
             self.stream = None
 
@@ -135,24 +173,28 @@ class Transcriber(QObject):
 
     @Slot(np.ndarray)
     def receive_audio(self, data):
+        # Whole utterance at once: still decoded exactly once
+        self.receive_block(data)
+        self.end_utterance()
+
+    @Slot(np.ndarray)
+    def receive_block(self, block):
+        # Each block is fed once, as soon as it is captured
+        with tracer.span("accept_waveform"):
+            final = self.rec.AcceptWaveform(block.tobytes())
+        if final:
+            self._emit(self.rec.Result())       # the recognizer's own endpointer fired
+
+    @Slot()
+    def end_utterance(self):
         self.t.received_chunks += 1
-        data = data.tobytes()
-        print(f"[DEBUG] Utterance buffer size: {len(data)} bytes ({len(data)/AudioCaptureWorker.BLOCK_SIZE} blocks -> {len(data)/16000/2:.2f} sec)")
-        while data:
-            if self.rec.AcceptWaveform(data):
-                result = json.loads(self.rec.FinalResult())
-                print("[DEBUG] Raw recognizer.Result():", result)
-                self.transcription.emit(result.get('text'))
-                self.t.received_chunks += 1
-                break
-            else:
-                blocks = min(len(data) // AudioCaptureWorker.BLOCK_SIZE, AudioCaptureWorker.MAX_SILENCE_BLOCKS) -1
-                print(f'[PARTIAL] ({blocks}->{blocks*AudioCaptureWorker.BLOCK_SIZE}) "{self.rec.PartialResult()}"')
-                if blocks > 0:
-                    data = data[-blocks*AudioCaptureWorker.BLOCK_SIZE:]
-                else:
-                    self.rec.FinalResult()
-                    break
+        with tracer.span("final_result"):
+            self._emit(self.rec.FinalResult())
+
+    def _emit(self, result_json):
+        text = json.loads(result_json).get('text')
+        if text:
+            self.transcription.emit(text)
 
 
 class AudioPipeline(QObject):
@@ -172,7 +214,8 @@ class AudioPipeline(QObject):
 
         # Connect signals
         self.capture_thread.started.connect(self.capture_worker.start)
-        self.capture_worker.audio_chunk.connect(self.transcriber.receive_audio)
+        self.capture_worker.audio_block.connect(self.transcriber.receive_block)
+        self.capture_worker.utterance_end.connect(self.transcriber.end_utterance)
 
         self.transcriber.transcription.connect(self.handle_transcription)
 
@@ -0,0 +1,153 @@
+# src/aikeyboard/batch.py
+"""Headless batch transcription of a directory of WAV/FLAC files.
+
+    python -m aikeyboard.batch recordings/ -o transcripts.jsonl
+
+One worker process per core, each with its own copy of the model; results
+are written as JSON lines as soon as each file is done. Flight recordings
+saved from the tray (.npz) are accepted too.
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import time
+from pathlib import Path
+from typing import List, Optional
+
+from aikeyboard.audio_io import AUDIO_SUFFIXES, read_audio
+from aikeyboard.resampler import StreamResampler
+from aikeyboard.vad import VoiceActivityGate
+
+OUTPUT_RATE = 16000
+BLOCK_FRAMES = 4096
+
+_model_path: Optional[str] = None
+_use_vad = True
+
+
+def _init_worker(model_path: str, use_vad: bool):
+    global _model_path, _use_vad
+    from vosk import SetLogLevel
+    SetLogLevel(-1)
+    _model_path, _use_vad = model_path, use_vad
+
+
+def transcribe_file(path: Path) -> dict:
+    """Run one file through the same resampler/VAD/recognizer chain as SpeechWorker."""
+    from aikeyboard.model_pool import model_pool
+    started = time.perf_counter()
+    samples, rate = read_audio(path)
+    rec = model_pool.acquire_recognizer(_model_path, OUTPUT_RATE)
+    resampler = StreamResampler(rate, OUTPUT_RATE, BLOCK_FRAMES) if rate != OUTPUT_RATE else None
+    vad = VoiceActivityGate(OUTPUT_RATE) if _use_vad else None
+    utterances: List[dict] = []
+    position = 0                    # samples at OUTPUT_RATE fed so far, silence included
+    start: Optional[int] = None
+
+    def close(result_json: str):
+        nonlocal start
+        text = json.loads(result_json).get("text", "").strip()
+        if text:
+            utterances.append({"start": (start or 0) / OUTPUT_RATE, "end": position / OUTPUT_RATE, "text": text})
+        start = None
+
+    try:
+        for offset in range(0, len(samples), BLOCK_FRAMES):
+            block = samples[offset:offset + BLOCK_FRAMES]
+            pcm = resampler.process(block) if resampler else block
+            position += len(pcm)
+            data = pcm.tobytes()
+            if vad:
+                event = vad.feed(pcm)
+                if event == vad.SILENCE:
+                    continue
+                if event == vad.ENDPOINT:
+                    close(rec.FinalResult())
+                    continue
+                if event == vad.ONSET:
+                    data = vad.pre_roll().tobytes() + data
+            if start is None:
+                start = position - len(data) // 2
+            if rec.AcceptWaveform(data):
+                close(rec.Result())
+        close(rec.FinalResult())
+    finally:
+        model_pool.release_recognizer(rec)
+
+    return {
+        "file": str(path),
+        "duration": len(samples) / rate,
+        "elapsed": time.perf_counter() - started,
+        "text": " ".join(u["text"] for u in utterances),
+        "utterances": utterances,
+    }
+
+
+def _transcribe_safe(path: Path) -> dict:
+    try:
+        return transcribe_file(path)
+    except Exception as e:
+        return {"file": str(path), "error": str(e), "duration": 0.0, "elapsed": 0.0}
+
+
+def find_audio(root: Path, recursive: bool) -> List[Path]:
+    pattern = "**/*" if recursive else "*"
+    files = [p for p in root.glob(pattern) if p.suffix.lower() in AUDIO_SUFFIXES and p.is_file()]
+    # Longest first so the pool does not end waiting on one big file
+    return sorted(files, key=lambda p: p.stat().st_size, reverse=True)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Transcribe a directory of WAV/FLAC files")
+    parser.add_argument("input", type=Path, help="directory with audio files")
+    parser.add_argument("-o", "--output", type=Path, help="JSONL output file (default: stdout)")
+    parser.add_argument("-m", "--model", help="model name (default: the configured one)")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count() or 1, help="worker processes")
+    parser.add_argument("-r", "--recursive", action="store_true", help="descend into subdirectories")
+    parser.add_argument("--no-vad", action="store_true", help="decode silence too")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    files = find_audio(args.input, args.recursive)
+    if not files:
+        logging.error(f"No audio files in {args.input}")
+        return 1
+    # model_cache reads its settings through app_config, which imports device_manager:
+    # no audio capture here, so keep it from opening PortAudio and probing devices
+    os.environ.setdefault("AIKEYBOARD_CAPTURE", "synthetic")
+    from aikeyboard.model_cache import model_cache
+    from aikeyboard.model_pins import model_pins
+    model_path = model_cache.ensure_model(args.model, pin=True)     # workers load it later
+    jobs = max(1, min(args.jobs, len(files)))
+    logging.info(f"Transcribing {len(files)} files with {jobs} workers using {model_path}")
+
+    out = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+    audio_seconds = decode_seconds = 0.0
+    failures = 0
+    started = time.perf_counter()
+    try:
+        ctx = multiprocessing.get_context("spawn")
+        with ctx.Pool(jobs, initializer=_init_worker, initargs=(model_path, not args.no_vad)) as pool:
+            for result in pool.imap_unordered(_transcribe_safe, files):
+                out.write(json.dumps(result, ensure_ascii=False) + "\n")
+                out.flush()
+                failures += "error" in result
+                audio_seconds += result["duration"]
+                decode_seconds += result["elapsed"]
+    finally:
+        if out is not sys.stdout:
+            out.close()
+        model_pins.unpin(model_path)
+    wall = time.perf_counter() - started
+    if audio_seconds:
+        logging.info(f"{audio_seconds:.1f} s of audio in {wall:.1f} s: "
+                     f"real-time factor {wall / audio_seconds:.3f} "
+                     f"({decode_seconds / audio_seconds:.3f} per worker), {failures} failed")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,42 @@
+# src/aikeyboard/block_controller.py
+
+
+class BlockSizeController:
+    """Chooses how many captured frames to decode per iteration.
+
+    Small blocks give low latency while the decoder keeps up; when decoding
+    a block takes too large a share of its own duration, or a backlog builds
+    up in the capture ring, blocks are doubled to amortize per-call overhead,
+    and halved again once the load drops.
+    """
+
+    def __init__(self, rate: int, min_frames: int = 1024, max_frames: int = 8192,
+                 high_load: float = 0.6, low_load: float = 0.25, cooldown: int = 4):
+        self.rate = rate
+        self.min_frames = max(1, min_frames)
+        self.max_frames = max(self.min_frames, max_frames)
+        self.high_load = high_load
+        self.low_load = low_load
+        self.cooldown = cooldown
+        self.frames = self.min_frames
+        self.load = 0.0             # smoothed decode time / block duration
+        self._hold = 0
+
+    @classmethod
+    def from_seconds(cls, rate: int, min_block: float, max_block: float, **kwargs) -> 'BlockSizeController':
+        return cls(rate, int(rate * min_block), int(rate * max_block), **kwargs)
+
+    def update(self, frames: int, decode_seconds: float, backlog_frames: int) -> int:
+        """Account for one decoded block and return the size of the next one."""
+        if frames:
+            self.load += 0.3 * (decode_seconds * self.rate / frames - self.load)
+        if self._hold:
+            self._hold -= 1
+            return self.frames
+        if (self.load > self.high_load or backlog_frames > 2 * self.frames) and self.frames < self.max_frames:
+            self.frames = min(self.frames * 2, self.max_frames)
+            self._hold = self.cooldown
+        elif self.load < self.low_load and backlog_frames < self.frames and self.frames > self.min_frames:
+            self.frames = max(self.frames // 2, self.min_frames)
+            self._hold = self.cooldown
+        return self.frames
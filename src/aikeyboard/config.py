@@ -1,8 +1,18 @@
 # src/aikeyboard/config.py
+import json
+import logging
 from PySide6.QtCore import QObject, Property, QSettings, Signal
-from typing import Optional
+from typing import Dict, List, Optional
 from aikeyboard.device_manager import device_manager
 
+# Command mode vocabulary: phrase -> "text:<characters>", "key:<key name>" or "undo" (remove the last phrase)
+DEFAULT_COMMANDS = {
+    "punto": "text:.", "virgola": "text:,", "due punti": "text::", "punto e virgola": "text:;",
+    "punto interrogativo": "text:?", "punto esclamativo": "text:!",
+    "a capo": "key:Return", "tabulazione": "key:Tab",
+    "cancella": "undo",
+}
+
 class _AppConfig(QObject):
     deviceChanged = Signal(str)
     modelChanged = Signal(str)
@@ -34,4 +44,73 @@ class _AppConfig(QObject):
 
     model = Property(str, get_model, set_model, None, '', notify=modelChanged)
 
+    def get_model_memory_mb(self) -> int:
+        return int(self._settings.value("model_memory_mb", 2048))
+    def set_model_memory_mb(self, mb: int):
+        self._settings.setValue("model_memory_mb", int(mb))
+
+    model_memory_mb = Property(int, get_model_memory_mb, set_model_memory_mb)
+
+    def get_partial_interval_ms(self) -> int:
+        return int(self._settings.value("partial_interval_ms", 250))
+    def set_partial_interval_ms(self, ms: int):
+        self._settings.setValue("partial_interval_ms", int(ms))
+
+    partial_interval_ms = Property(int, get_partial_interval_ms, set_partial_interval_ms)
+
+    def get_languages(self) -> List[str]:
+        """Languages decoded in parallel; fewer than two means single-model mode."""
+        value = self._settings.value("languages", "")
+        return [lang.strip() for lang in str(value).split(",") if lang.strip()]
+    def set_languages(self, langs: List[str]):
+        self._settings.setValue("languages", ",".join(langs))
+
+    languages = Property(list, get_languages, set_languages)
+
+    def get_decoder_process(self) -> bool:
+        return str(self._settings.value("decoder_process", "false")).lower() == "true"
+    def set_decoder_process(self, enabled: bool):
+        self._settings.setValue("decoder_process", "true" if enabled else "false")
+
+    decoder_process = Property(bool, get_decoder_process, set_decoder_process)
+
+    def get_min_block_ms(self) -> int:
+        """Smallest audio block handed to the decoder while it keeps up."""
+        return int(self._settings.value("min_block_ms", 64))
+    def set_min_block_ms(self, ms: int):
+        self._settings.setValue("min_block_ms", int(ms))
+
+    min_block_ms = Property(int, get_min_block_ms, set_min_block_ms)
+
+    def get_max_block_ms(self) -> int:
+        """Largest block used when the decoder falls behind."""
+        return int(self._settings.value("max_block_ms", 512))
+    def set_max_block_ms(self, ms: int):
+        self._settings.setValue("max_block_ms", int(ms))
+
+    max_block_ms = Property(int, get_max_block_ms, set_max_block_ms)
+
+    def get_model_cache_quota_mb(self) -> int:
+        """Disk space for downloaded models, least recently used evicted first; 0 means no limit."""
+        return int(self._settings.value("model_cache_quota_mb", 8192))
+    def set_model_cache_quota_mb(self, mb: int):
+        self._settings.setValue("model_cache_quota_mb", int(mb))
+
+    model_cache_quota_mb = Property(int, get_model_cache_quota_mb, set_model_cache_quota_mb)
+
+    def get_commands(self) -> Dict[str, str]:
+        """Command mode phrases and their actions, see DEFAULT_COMMANDS; stored as a JSON object."""
+        value = self._settings.value("commands")
+        if not value:
+            return dict(DEFAULT_COMMANDS)
+        try:
+            return dict(json.loads(value))
+        except (TypeError, ValueError) as e:
+            logging.warning(f"config: invalid commands setting, using the defaults: {e}")
+            return dict(DEFAULT_COMMANDS)
+    def set_commands(self, commands: Dict[str, str]):
+        self._settings.setValue("commands", json.dumps(commands, ensure_ascii=False))
+
+    commands = Property(dict, get_commands, set_commands)
+
 app_config = _AppConfig()
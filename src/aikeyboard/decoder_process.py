@@ -0,0 +1,268 @@
+# src/aikeyboard/decoder_process.py
+import json
+import logging
+import multiprocessing
+import sys
+import time
+from multiprocessing import resource_tracker, shared_memory
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from aikeyboard.ring_buffer import AudioRingBuffer
+
+_HEADER = 16    # two int64 positions: written, read_pos
+
+
+def _attach(name: str, size: int) -> shared_memory.SharedMemory:
+    """Open an existing segment without registering it with the resource tracker.
+
+    Only the creator unlinks the segment. Before Python 3.13 attaching
+    registers it as if this process owned it, which gives leak warnings or a
+    second unlink; unregistering afterwards is no better, since a spawned
+    child shares the parent's tracker and would drop the creator's entry.
+    """
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, size=size, track=False)
+    register = resource_tracker.register
+    resource_tracker.register = lambda name, rtype: None
+    try:
+        return shared_memory.SharedMemory(name=name, size=size)
+    finally:
+        resource_tracker.register = register
+
+
+class SharedAudioRing(AudioRingBuffer):
+    """AudioRingBuffer whose samples and positions live in shared memory.
+
+    The creating process writes (put) and unlinks the segment, the attached
+    process reads (get); `data_ready` must be a multiprocessing.Event shared
+    by both.
+    """
+
+    def __init__(self, capacity: int, name: Optional[str] = None, data_ready=None):
+        self.capacity = int(capacity)
+        self._owner = name is None
+        size = _HEADER + 2 * self.capacity
+        if self._owner:
+            self._shm = shared_memory.SharedMemory(create=True, size=size)
+        else:
+            self._shm = _attach(name, size)
+        self._header = np.ndarray((2,), dtype=np.int64, buffer=self._shm.buf)
+        self._buf = np.ndarray((self.capacity,), dtype=np.int16, buffer=self._shm.buf, offset=_HEADER)
+        if self._owner:
+            self._header[:] = 0
+        self.overruns = 0
+        self.dropped = 0
+        self.input_overflows = 0
+        self.last_put_time = 0.0
+        self._data_ready = data_ready
+
+    @property
+    def name(self) -> str:
+        return self._shm.name
+
+    @property
+    def written(self) -> int:
+        return int(self._header[0])
+
+    @written.setter
+    def written(self, value: int):
+        self._header[0] = value
+
+    @property
+    def read_pos(self) -> int:
+        return int(self._header[1])
+
+    @read_pos.setter
+    def read_pos(self, value: int):
+        self._header[1] = value
+
+    def close(self):
+        # Views must go before the mapping can be closed
+        del self._header, self._buf
+        self._shm.close()
+        if self._owner:
+            self._shm.unlink()
+
+
+def _decoder_main(conn, ring_name: str, capacity: int, data_ready, model_path: str, rate: int,
+                  partial_interval: Optional[float]):
+    """Decoder process: drain the shared ring into a recognizer, send results over `conn`."""
+    from vosk import KaldiRecognizer, Model, SetLogLevel
+    SetLogLevel(-1)
+    ring = SharedAudioRing(capacity, ring_name, data_ready)
+    rec = KaldiRecognizer(Model(model_path), rate)
+    block = np.empty(rate // 2, dtype=np.int16)
+    last_partial, last_partial_time = "", 0.0
+
+    def drain(upto: Optional[int] = None):
+        """Decode queued audio, up to the write position `upto` when given.
+
+        Without a limit it stops at a pending command: audio written after
+        the command was sent belongs to the next utterance.
+        """
+        nonlocal last_partial, last_partial_time
+        while True:
+            end = ring.written if upto is None else upto
+            count = min(end - ring.read_pos, len(block))
+            if count <= 0 or (upto is None and conn.poll()):
+                return
+            chunk = ring.get(count, out=block)
+            if rec.AcceptWaveform(chunk.tobytes()):
+                conn.send(("final", json.loads(rec.Result()).get("text", "")))
+                last_partial = ""
+            elif partial_interval is not None and time.monotonic() - last_partial_time >= partial_interval:
+                last_partial_time = time.monotonic()
+                partial = json.loads(rec.PartialResult()).get("partial", "")
+                if partial and partial != last_partial:
+                    last_partial = partial
+                    conn.send(("partial", partial))
+
+    try:
+        while True:
+            data_ready.clear()
+            drain()
+            if conn.poll():
+                command, write_pos, *args = conn.recv()
+                drain(write_pos)     # audio written before the command belongs to it
+                if command == "final":
+                    conn.send(("final", json.loads(rec.FinalResult()).get("text", "")))
+                    last_partial = ""
+                elif command == "reset":
+                    rec.Reset()
+                    last_partial = ""
+                    conn.send(("reset", ""))    # what follows is decoded after the reset
+                elif command == "sync":
+                    conn.send(("sync", ""))     # everything sent before has been answered
+                elif command == "model":
+                    rec = KaldiRecognizer(Model(args[0]), rate)
+                elif command == "quit":
+                    break
+                continue
+            data_ready.wait(0.5)
+    finally:
+        ring.close()
+        conn.close()
+
+
+class RemoteRecognizer:
+    """KaldiRecognizer stand-in that decodes in a subprocess.
+
+    Audio goes through a SharedAudioRing, results come back asynchronously
+    and are collected with poll(), or with flush() to wait for all of them.
+    FinalResult() only requests the flush, so its own return value is always
+    empty. Results of audio sent before Reset() are dropped.
+    """
+    EMPTY_RESULT = '{"text": ""}'
+    FLUSH_TIMEOUT = 5.0
+
+    def __init__(self, model_path: str, rate: int = 16000, partial_interval: Optional[float] = None,
+                 ring_seconds: float = 10.0):
+        self.model_path = model_path
+        self.rate = rate
+        self.partial_interval = partial_interval
+        self.ring_seconds = ring_seconds
+        self.overruns = 0           # audio blocks cut short because the decoder fell behind
+        self.dropped = 0
+        self._start()
+
+    def _start(self):
+        ctx = multiprocessing.get_context('spawn')
+        self.ring = SharedAudioRing(int(self.rate * self.ring_seconds), data_ready=ctx.Event())
+        self._conn, child = ctx.Pipe()
+        self._proc = ctx.Process(
+            target=_decoder_main,
+            args=(child, self.ring.name, self.ring.capacity, self.ring._data_ready,
+                  self.model_path, self.rate, self.partial_interval),
+            daemon=True)
+        self._proc.start()
+        child.close()
+        self._resets = 0            # Reset() calls not acknowledged yet
+        self._synced = False
+        logging.info(f'RemoteRecognizer: decoder process {self._proc.pid} started for {self.model_path}')
+
+    def _send(self, command: str, *args):
+        # The write position tells the decoder which audio precedes the command
+        try:
+            self._conn.send((command, self.ring.written) + args)
+        except OSError:
+            return  # process is gone, poll() will restart it
+        self.ring._data_ready.set()
+
+    def AcceptWaveform(self, data: bytes) -> bool:
+        samples = np.frombuffer(data, dtype=np.int16)
+        n = self.ring.put(samples)
+        if n < len(samples):
+            self.overruns += 1
+            self.dropped += len(samples) - n
+            logging.warning(f"RemoteRecognizer: decoder process fell behind, {self.dropped} samples dropped so far")
+        return False
+
+    def PartialResult(self) -> str:
+        return '{"partial": ""}'
+
+    def FinalResult(self) -> str:
+        self._send("final")
+        return self.EMPTY_RESULT
+
+    Result = FinalResult
+
+    def Reset(self):
+        self._resets += 1
+        self._send("reset")
+
+    def swap_model(self, model_path: str):
+        self.model_path = model_path
+        self._send("model", model_path)
+
+    def poll(self) -> List[Tuple[str, str]]:
+        """Results received so far as ("final"|"partial"|"error", text) tuples."""
+        results = []
+        try:
+            while self._conn.poll():
+                kind, text = self._conn.recv()
+                if kind == "reset":
+                    self._resets -= 1
+                elif kind == "sync":
+                    self._synced = True
+                elif not self._resets:      # otherwise decoded before a reset
+                    results.append((kind, text))
+        except (EOFError, OSError):
+            pass
+        if not self._proc.is_alive():
+            logging.error(f'RemoteRecognizer: decoder process exited with code {self._proc.exitcode}, restarting')
+            self._stop()
+            self._start()
+            results.append(("error", "Speech decoder crashed and was restarted"))
+        return results
+
+    def flush(self, timeout: float = FLUSH_TIMEOUT) -> List[Tuple[str, str]]:
+        """Like poll(), but first waits up to `timeout` for the results of everything sent so far."""
+        results = []
+        deadline = time.monotonic() + timeout
+        self._synced = False
+        self._send("sync")
+        while not self._synced:
+            remaining = deadline - time.monotonic()
+            try:
+                ready = remaining > 0 and self._conn.poll(remaining)
+            except (EOFError, OSError):
+                ready = False
+            results += self.poll()
+            if not ready or (results and results[-1][0] == "error"):
+                break
+        if not self._synced:
+            logging.warning(f'RemoteRecognizer: decoder process did not catch up within {timeout} s')
+        return results
+
+    def _stop(self):
+        self._proc.join(timeout=2)
+        if self._proc.is_alive():
+            self._proc.terminate()
+        self._conn.close()
+        self.ring.close()
+
+    def close(self):
+        self._send("quit")
+        self._stop()
@@ -1,27 +1,424 @@
 # src/aikeyboard/device_manager.py
-import pyaudio
+import logging
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Callable, List, Optional, Tuple
+
+import numpy as np
 
 #from PySide6.QtGui import QAction
 from PySide6.QtCore import QObject
 
+from aikeyboard.audio_io import read_audio
+from aikeyboard.tracing import tracer
+
+COMMON_RATES = (8000, 16000, 22050, 32000, 44100, 48000)
+
+Sink = Callable[[np.ndarray], object]
+
+
+class CaptureStream(ABC):
+    """Running capture pushing mono int16 blocks into a ring buffer or a sink callable.
+
+    Mirrors the part of the PyAudio stream API the workers use
+    (start_stream/stop_stream/is_active/close); streams are returned
+    already started. `input_latency` is the measured delay, in seconds,
+    between a block being captured and it reaching the sink.
+    """
+
+    def __init__(self, rate: int, frames_per_buffer: int, ring=None, sink: Optional[Sink] = None):
+        self.rate = rate
+        self.frames_per_buffer = frames_per_buffer
+        self.ring = ring
+        self.sink: Sink = sink or ring.put
+        self.input_latency = 0.0
+        self.input_overflows = 0
+
+    def _measured(self, latency: float):
+        if latency > 0:
+            self.input_latency += 0.1 * (latency - self.input_latency) if self.input_latency else latency
+
+    def _overflow(self):
+        tracer.instant("input_overflow")
+        self.input_overflows += 1
+        if self.ring is not None:
+            self.ring.input_overflows += 1
+
+    @abstractmethod
+    def start_stream(self):
+        ...
+
+    @abstractmethod
+    def stop_stream(self):
+        ...
+
+    @abstractmethod
+    def is_active(self) -> bool:
+        ...
+
+    @abstractmethod
+    def close(self):
+        ...
+
+
+class CaptureBackend(ABC):
+    """A source of audio input devices; devices are identified by index."""
+    name = ""
+
+    @abstractmethod
+    def devices(self) -> List[Tuple[int, str]]:
+        """(index, name) of every device with input channels."""
+
+    @abstractmethod
+    def device_info(self, index: int) -> dict:
+        """PortAudio style info: name, defaultSampleRate, maxInputChannels."""
+
+    def default_device(self) -> int:
+        return self.devices()[0][0]
+
+    def native_rates(self, index: int) -> List[int]:
+        """Sample rates the device captures at without conversion."""
+        return [int(self.device_info(index)['defaultSampleRate'])]
+
+    @abstractmethod
+    def open(self, rate: int, index: int, frames_per_buffer: int, ring=None,
+             sink: Optional[Sink] = None) -> CaptureStream:
+        """Started stream delivering to `ring` or `sink`."""
+
+    def close(self):
+        pass
+
+
+class _PyAudioStream(CaptureStream):
+    def __init__(self, pa, rate, index, frames_per_buffer, ring=None, sink=None):
+        super().__init__(rate, frames_per_buffer, ring, sink)
+        import pyaudio
+        overflow_flag, go_on = pyaudio.paInputOverflow, pyaudio.paContinue
+
+        def _callback(in_data, _frame_count, time_info, status):
+            tracer.name_thread("PortAudio callback")
+            with tracer.span("capture"):
+                self.sink(np.frombuffer(in_data, dtype=np.int16))
+            if status & overflow_flag:
+                self._overflow()
+            adc_time = time_info.get('input_buffer_adc_time', 0.0)
+            if adc_time:
+                self._measured(time_info['current_time'] - adc_time)
+            return (None, go_on)
+
+        self._stream = pa.open(format=pyaudio.paInt16, channels=1, rate=rate, input=True,
+                               input_device_index=index, frames_per_buffer=frames_per_buffer,
+                               stream_callback=_callback)
+        self.input_latency = self._stream.get_input_latency()
+
+    def start_stream(self):
+        self._stream.start_stream()
+
+    def stop_stream(self):
+        self._stream.stop_stream()
+
+    def is_active(self) -> bool:
+        return self._stream.is_active()
+
+    def close(self):
+        self._stream.close()
+
+
+class PortAudioBackend(CaptureBackend):
+    """PyAudio in callback mode: the buffer PortAudio hands over is wrapped, not copied."""
+    name = "portaudio"
 
-class _DeviceManager(QObject):
     def __init__(self):
+        import pyaudio
         self.pa = pyaudio.PyAudio()
+
+    def devices(self):
+        return [(i, info["name"]) for i, info in
+                ((i, self.pa.get_device_info_by_index(i)) for i in range(self.pa.get_device_count()))
+                if info.get("maxInputChannels", 0) > 0]
+
+    def device_info(self, index):
+        return self.pa.get_device_info_by_index(index)
+
+    def default_device(self):
+        return int(self.pa.get_default_input_device_info()['index'])
+
+    def native_rates(self, index):
+        import pyaudio
+        rates = []
+        for rate in COMMON_RATES:
+            try:
+                if self.pa.is_format_supported(rate, input_device=index, input_channels=1,
+                                               input_format=pyaudio.paInt16):
+                    rates.append(rate)
+            except ValueError:
+                pass
+        return rates
+
+    def open(self, rate, index, frames_per_buffer, ring=None, sink=None):
+        return _PyAudioStream(self.pa, rate, index, frames_per_buffer, ring, sink)
+
+    def close(self):
+        self.pa.terminate()
+
+
+class _SoundDeviceStream(CaptureStream):
+    def __init__(self, rate, index, frames_per_buffer, ring=None, sink=None):
+        super().__init__(rate, frames_per_buffer, ring, sink)
+        import sounddevice as sd
+
+        def _callback(indata, _frames, time_info, status):
+            tracer.name_thread("sounddevice callback")
+            with tracer.span("capture"):
+                self.sink(indata.reshape(-1))
+            if status.input_overflow:
+                self._overflow()
+            if time_info.inputBufferAdcTime:
+                self._measured(time_info.currentTime - time_info.inputBufferAdcTime)
+
+        self._stream = sd.InputStream(samplerate=rate, blocksize=frames_per_buffer, dtype='int16',
+                                      channels=1, callback=_callback, device=index)
+        self.input_latency = float(self._stream.latency)
+        self._stream.start()
+
+    def start_stream(self):
+        self._stream.start()
+
+    def stop_stream(self):
+        self._stream.stop()
+
+    def is_active(self) -> bool:
+        return self._stream.active
+
+    def close(self):
+        self._stream.close()
+
+
+class SoundDeviceBackend(CaptureBackend):
+    """python-sounddevice (also PortAudio), for systems where PyAudio is not available."""
+    name = "sounddevice"
+
+    def __init__(self):
+        import sounddevice
+        self.sd = sounddevice
+
+    def devices(self):
+        return [(i, d["name"]) for i, d in enumerate(self.sd.query_devices()) if d["max_input_channels"] > 0]
+
+    def device_info(self, index):
+        d = self.sd.query_devices(index)
+        return {"index": index, "name": d["name"], "defaultSampleRate": float(d["default_samplerate"]),
+                "maxInputChannels": d["max_input_channels"]}
+
+    def default_device(self):
+        return int(self.sd.default.device[0])
+
+    def native_rates(self, index):
+        rates = []
+        for rate in COMMON_RATES:
+            try:
+                self.sd.check_input_settings(device=index, channels=1, dtype='int16', samplerate=rate)
+                rates.append(rate)
+            except Exception:
+                pass
+        return rates
+
+    def open(self, rate, index, frames_per_buffer, ring=None, sink=None):
+        return _SoundDeviceStream(rate, index, frames_per_buffer, ring, sink)
+
+
+class _FeederStream(CaptureStream):
+    """Pushes generated blocks from a thread, paced in real time or as fast as the ring drains.
+
+    Unpaced streams wait for room in the ring instead of overrunning it.
+    """
+
+    def __init__(self, rate, frames_per_buffer, blocks, realtime=True, ring=None, sink=None,
+                 on_eof: Optional[Callable[[], None]] = None):
+        super().__init__(rate, frames_per_buffer, ring, sink)
+        self.realtime = realtime
+        self.on_eof = on_eof
+        self._blocks = blocks
+        self._running = threading.Event()
+        self._closed = False
+        self._running.set()
+        self._thread = threading.Thread(target=self._feed, daemon=True)
+        self._thread.start()
+
+    def _feed(self):
+        started, sent = time.monotonic(), 0
+        for block in self._blocks:
+            if self.realtime:
+                due = started + (sent + len(block)) / self.rate
+                delay = due - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                self._measured(time.monotonic() - due + len(block) / self.rate)
+            elif self.ring is not None:
+                while not self._closed and self.ring.capacity - self.ring.available() < len(block):
+                    time.sleep(0.0005)
+            if not self._running.is_set():
+                # Like a stopped device: what "arrives" meanwhile is lost
+                self._running.wait()
+                started, sent = time.monotonic(), 0
+            if self._closed:
+                return
+            with tracer.span("capture"):
+                self.sink(block)
+            sent += len(block)
+        # Let the consumer drain what is left before reporting the end
+        while not self._closed and self.ring is not None and self.ring.available():
+            time.sleep(0.001)
+        if not self._closed and self.on_eof:
+            self.on_eof()
+
+    def start_stream(self):
+        self._running.set()
+
+    def stop_stream(self):
+        self._running.clear()
+
+    def is_active(self) -> bool:
+        return self._running.is_set() and self._thread.is_alive()
+
+    def close(self):
+        self._closed = True
+        self._running.set()
+
+
+class FileBackend(CaptureBackend):
+    """A WAV/FLAC/.npz recording played back as the only input device.
+
+    With realtime=False the file is pushed as fast as the consumer keeps up,
+    which is what benchmarks want; `loop` replays it forever, `on_eof` is
+    called once everything was consumed.
+    """
+    name = "file"
+
+    def __init__(self, path, realtime: bool = True, loop: bool = False, trailing_silence: float = 0.0,
+                 on_eof: Optional[Callable[[], None]] = None):
+        self.path = Path(path)
+        samples, self.rate = read_audio(self.path)
+        self.duration = len(samples) / self.rate
+        if trailing_silence:
+            samples = np.concatenate([samples, np.zeros(int(trailing_silence * self.rate), dtype=np.int16)])
+        self.samples = samples
+        self.realtime = realtime
+        self.loop = loop
+        self.on_eof = on_eof
+
+    def devices(self):
+        return [(0, self.path.name)]
+
+    def device_info(self, index):
+        return {"index": 0, "name": self.path.name, "defaultSampleRate": float(self.rate), "maxInputChannels": 1}
+
+    def _blocks(self, frames):
+        while True:
+            for offset in range(0, len(self.samples), frames):
+                yield self.samples[offset:offset + frames]
+            if not self.loop:
+                return
+
+    def open(self, rate, index, frames_per_buffer, ring=None, sink=None):
+        if rate != self.rate:
+            raise ValueError(f"{self.path.name} is recorded at {self.rate} Hz, not {rate} Hz")
+        return _FeederStream(rate, frames_per_buffer, self._blocks(frames_per_buffer), self.realtime,
+                             ring, sink, self.on_eof)
+
+
+class SyntheticBackend(CaptureBackend):
+    """Generated input for load tests: a noise floor with periodic voice-like bursts.
+
+    Bursts are a 150 Hz harmonic series under a 4 Hz syllable envelope,
+    loud enough to open the VAD, so the whole decode path gets exercised.
+    """
+    name = "synthetic"
+
+    def __init__(self, rate: int = 48000, burst: float = 1.5, gap: float = 1.0,
+                 level_db: float = -20.0, noise_db: float = -60.0, realtime: bool = True):
+        self.rate = rate
+        self.burst = burst
+        self.gap = gap
+        self.level = 32767 * 10 ** (level_db / 20)
+        self.noise = 32767 * 10 ** (noise_db / 20)
+        self.realtime = realtime
+
+    def devices(self):
+        return [(0, "Synthetic input")]
+
+    def device_info(self, index):
+        return {"index": 0, "name": "Synthetic input", "defaultSampleRate": float(self.rate), "maxInputChannels": 1}
+
+    def native_rates(self, index):
+        return list(COMMON_RATES)
+
+    def _blocks(self, rate, frames):
+        rng = np.random.default_rng()
+        period = self.burst + self.gap
+        position = 0
+        while True:
+            t = (position + np.arange(frames)) / rate
+            block = rng.normal(0.0, self.noise, frames)
+            voiced = (t % period) < self.burst
+            if voiced.any():
+                envelope = 0.5 - 0.5 * np.cos(2 * np.pi * 4.0 * t)
+                tone = sum(np.sin(2 * np.pi * 150.0 * k * t) / k for k in range(1, 6))
+                block += voiced * envelope * tone * (self.level / 2.3)
+            position += frames
+            yield np.clip(block, -32768, 32767).astype(np.int16)
+
+    def open(self, rate, index, frames_per_buffer, ring=None, sink=None):
+        return _FeederStream(rate, frames_per_buffer, self._blocks(rate, frames_per_buffer), self.realtime,
+                             ring, sink)
+
+
+def create_backend(spec: str = "auto") -> CaptureBackend:
+    """Backend from a spec: auto, portaudio, sounddevice, synthetic or file:<path>.
+
+    "auto" prefers PyAudio callback capture and falls back to sounddevice.
+    """
+    if spec.startswith("file:"):
+        return FileBackend(spec[5:], loop=True)
+    if spec == "synthetic":
+        return SyntheticBackend()
+    if spec == "sounddevice":
+        return SoundDeviceBackend()
+    if spec == "portaudio":
+        return PortAudioBackend()
+    if spec != "auto":
+        raise ValueError(f"Unknown capture backend '{spec}'")
+    try:
+        return PortAudioBackend()
+    except ImportError:
+        logging.info('DeviceManager: PyAudio not available, using sounddevice')
+    return SoundDeviceBackend()
+
+
+class _DeviceManager(QObject):
+    def __init__(self):
+        # AIKEYBOARD_CAPTURE selects the backend, e.g. "synthetic" on headless machines
+        self.backend = create_backend(os.environ.get("AIKEYBOARD_CAPTURE", "auto"))
         self.current_device = None
         self.devices = None
 
+    def set_backend(self, backend: CaptureBackend):
+        self.backend.close()
+        self.backend = backend
+        self.devices = None
+
     def shutdown(self):
-        self.pa.terminate()
+        self.backend.close()
         #global device_manager
         #device_manager = None
 
     def get_physical_devices(self):
         if self.devices is None:
             self.devices = []
-            for i in range(self.pa.get_device_count()):
-                info = self.pa.get_device_info_by_index(i)
-                name = info.get("name", "")
+            for i, name in self.backend.devices():
                 if self._is_valid_input_device(name, i):
                     self.devices.append((i, name))
         return self.devices
@@ -47,46 +444,53 @@ class _DeviceManager(QObject):
 
         # Try to open the device and check usability
         try:
-            info = self.pa.get_device_info_by_index(index)
+            info = self.backend.device_info(index)
             rate = int(info['defaultSampleRate'])
             if info.get('maxInputChannels', 0) < 1: # type: ignore
                 return False
             # Try opening the device to ensure it's actually usable
-            stream = self.get_stream(rate, index, 512)
+            stream = self.open_stream(rate, index, 512, sink=lambda _samples: None)
             stream.close()
             return True
         except Exception:
             return False
-            
+
 
     def get_device_name(self, index):
         """Get display name for a device index"""
         try:
-            return self.pa.get_device_info_by_index(index)["name"]
+            return self.backend.device_info(index)["name"]
         except:  # noqa: E722
             return "Unknown Device"
-        
+
     def get_device_index(self, name):
         """Get index for a given device name"""
         return next(
-            (i for i in range(self.pa.get_device_count())
-            if self.pa.get_device_info_by_index(i)["name"] == name),
+            (i for i, n in self.backend.devices() if n == name),
             -1)  # Default if no match found
-    
-    def get_pa(self):
-        return self.pa
-    
-    def get_stream(self, rate, index, frames_per_buffer, **kwargs):
-        stream = self.pa.open(
-            format=pyaudio.paInt16,
-            channels=1,
-            rate=rate,
-            input=True,
-            input_device_index=index,
-            frames_per_buffer=frames_per_buffer,
-            **kwargs
-        )
+
+    def find_device(self, device=None) -> int:
+        """Index of a device given by index, (partial) name, or None for the default one."""
+        if device is None:
+            return self.backend.default_device()
+        if isinstance(device, int):
+            return device
+        return next((i for i, n in self.backend.devices() if device == n or device in n), -1)
+
+    def get_device_info(self, index) -> dict:
+        return self.backend.device_info(index)
+
+    def native_rates(self, index) -> List[int]:
+        return self.backend.native_rates(index)
+
+    def open_stream(self, rate, index, frames_per_buffer, ring=None, sink: Optional[Sink] = None) -> CaptureStream:
+        """Start capturing mono int16 audio into `ring` (an AudioRingBuffer) or `sink`.
+
+        Both are called from the capture thread with one block at a time.
+        """
+        stream = self.backend.open(rate, index, frames_per_buffer, ring, sink)
+        logging.debug(f'DeviceManager: {self.backend.name} capture from device {index} at {rate} Hz, '
+                      f'input latency {stream.input_latency * 1000:.1f} ms')
         return stream
 
-    
 device_manager = _DeviceManager()
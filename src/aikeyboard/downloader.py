@@ -0,0 +1,451 @@
+# src/aikeyboard/downloader.py
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, List, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+PIECE_SIZE = 16 * 1024 * 1024   # unit of work handed to a connection
+CHUNK_SIZE = 256 * 1024
+FLUSH_EVERY = 4 * 1024 * 1024   # bytes written before progress is flushed and recorded
+TIMEOUT = (10, 60)              # connect, read (seconds)
+ATTEMPTS = 5
+
+Progress = Callable[[int, int], None]   # (bytes done, total bytes)
+
+
+def make_session(connections: int = 4) -> requests.Session:
+    """Session whose connection pool is large enough for `connections` parallel ranges."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=2, pool_maxsize=max(connections, 2))
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+class FileLock:
+    """Exclusive lock on `path` between processes, released by the OS if the holder dies.
+
+    With `shared`, any number of holders exclude only exclusive ones (POSIX
+    only: on Windows a shared lock is not taken at all).
+    """
+
+    def __init__(self, path, timeout: Optional[float] = None, poll: float = 0.5, shared: bool = False):
+        self.path = Path(path)
+        self.timeout = timeout
+        self.poll = poll
+        self.shared = shared
+        self._file = None
+
+    def __enter__(self):
+        self._file = open(self.path, "a+b")
+        deadline = None if self.timeout is None else time.monotonic() + self.timeout
+        logged = False
+        while True:
+            try:
+                self._lock()
+                return self
+            except OSError:
+                if deadline is not None and time.monotonic() > deadline:
+                    self._file.close()
+                    raise TimeoutError(f"{self.path} is locked by another process")
+                if not logged:
+                    logging.info(f'FileLock: waiting for {self.path}')
+                    logged = True
+                time.sleep(self.poll)
+
+    def __exit__(self, *_exc):
+        self._unlock()
+        self._file.close()
+        return False
+
+    def _lock(self):
+        if os.name == "nt":
+            if self.shared:
+                return
+            import msvcrt
+            self._file.seek(0)
+            msvcrt.locking(self._file.fileno(), msvcrt.LK_NBLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(self._file.fileno(), (fcntl.LOCK_SH if self.shared else fcntl.LOCK_EX) | fcntl.LOCK_NB)
+
+    def _unlock(self):
+        if os.name == "nt":
+            if self.shared:
+                return
+            import msvcrt
+            self._file.seek(0)
+            msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+
+
+class RangeNotSupported(Exception):
+    pass
+
+
+class RemoteFileChanged(IOError):
+    """The file changed on the server while it was being fetched in pieces."""
+
+
+class RangedDownload:
+    """One URL fetched into numbered piece files under `parts_dir`.
+
+    Pieces are requested over up to `connections` parallel HTTP range
+    requests, in file order, by a background thread started with start().
+    parts_dir/state.json records how far each piece got, so a new instance
+    on the same directory resumes where the last one stopped, as long as the
+    remote file did not change (same size and ETag/Last-Modified). Servers
+    without range support get a single stream into piece 0, not resumable.
+
+    The file can be consumed while it arrives: read() blocks until the
+    bytes it asks for are in, and release() deletes the pieces a reader
+    will not come back to, so data need not be on disk twice.
+    """
+
+    def __init__(self, url: str, parts_dir, session: Optional[requests.Session] = None, connections: int = 4,
+                 progress: Optional[Progress] = None, piece_size: int = PIECE_SIZE, timeout=TIMEOUT):
+        self.url = url
+        self.parts_dir = Path(parts_dir)
+        self.session = session or make_session(connections)
+        self.connections = connections
+        self.progress = progress
+        self.piece_size = piece_size
+        self.timeout = timeout
+        self.size = 0               # 0 until known, for single-stream downloads
+        self.validator = ""
+        self.ranged = False
+        self.resumed = False        # state.json matched the remote file
+        self.consumed = 0           # bytes before this offset have been released
+        self.done: List[int] = [0]
+        self._cond = threading.Condition()
+        self._finished = False
+        self._cancelled = False
+        self._error: Optional[BaseException] = None
+        self._read_any = False      # a reader has seen data: the layout can no longer change
+        self._thread: Optional[threading.Thread] = None
+        self._reader = None         # (piece index, open file) of the last read()
+
+    @property
+    def state_path(self) -> Path:
+        return self.parts_dir / "state.json"
+
+    def piece_path(self, i: int) -> Path:
+        return self.parts_dir / f"{i:06d}"
+
+    def piece(self, i: int):
+        if not self.ranged:
+            return 0, self.size
+        start = i * self.piece_size
+        return start, min(start + self.piece_size, self.size)
+
+    def remaining(self, i: int) -> int:
+        start, end = self.piece(i)
+        return end - start - self.done[i]
+
+    @property
+    def completed(self) -> int:
+        return sum(self.done)
+
+    def available(self) -> int:
+        """Bytes from the start of the file that have arrived."""
+        with self._cond:
+            return self._available()
+
+    def _available(self) -> int:
+        total = 0
+        for i, done in enumerate(self.done):
+            total += done
+            if not self.ranged or self.remaining(i):
+                break
+        return total
+
+    def _save(self):
+        # Caller holds self._cond
+        if not self.ranged:
+            return
+        tmp = self.state_path.with_name(self.state_path.name + ".tmp")
+        with open(tmp, "w") as fo:
+            json.dump({"url": self.url, "size": self.size, "validator": self.validator,
+                       "piece_size": self.piece_size, "done": self.done, "consumed": self.consumed}, fo)
+        os.replace(tmp, self.state_path)
+
+    def _resume(self) -> bool:
+        try:
+            with open(self.state_path) as fi:
+                saved = json.load(fi)
+        except (OSError, ValueError):
+            return False
+        if (saved.get("url"), saved.get("size"), saved.get("validator")) != (self.url, self.size, self.validator):
+            return False
+        self.piece_size = saved["piece_size"]
+        done = saved.get("done", [])
+        if len(done) != (self.size + self.piece_size - 1) // self.piece_size:
+            return False
+        self.done = done
+        self.consumed = saved.get("consumed", 0)
+        return True
+
+    def _clear(self):
+        shutil.rmtree(self.parts_dir, ignore_errors=True)
+        self.parts_dir.mkdir(parents=True, exist_ok=True)
+
+    def start(self) -> 'RangedDownload':
+        self.parts_dir.mkdir(parents=True, exist_ok=True)
+        try:
+            head = self.session.head(self.url, allow_redirects=True, timeout=self.timeout)
+            head.raise_for_status()
+            self.url = head.url      # follow redirects once, not per range
+            headers = head.headers
+            size = int(headers.get("Content-Length", 0))
+            self.ranged = size > 0 and headers.get("Accept-Ranges", "").lower() == "bytes"
+        except requests.RequestException as e:
+            logging.info(f'download: HEAD {self.url} failed ({e}), probing with a range request')
+            size, headers = self._probe()
+            self.ranged = size > 0
+        self.validator = headers.get("ETag") or headers.get("Last-Modified") or ""
+        if self.ranged:
+            self.size = size
+            self.resumed = self._resume()
+            if not self.resumed:
+                self._clear()
+                self.done = [0] * ((size + self.piece_size - 1) // self.piece_size)
+                with self._cond:
+                    self._save()
+            elif self.completed:
+                logging.info(f'download: resuming {self.url} at {self.completed}/{size} bytes')
+        else:
+            self._clear()
+        if self.progress:
+            self.progress(self.completed, self.size)
+        self._thread = threading.Thread(target=self._run, name="RangedDownload", daemon=True)
+        self._thread.start()
+        return self
+
+    def _probe(self):
+        """Total size (0 if ranges are not supported) and headers, from a GET of the first byte."""
+        with self.session.get(self.url, headers={"Range": "bytes=0-0"}, stream=True, timeout=self.timeout) as r:
+            r.raise_for_status()
+            self.url = r.url
+            total = r.headers.get("Content-Range", "").rpartition("/")[2]
+            if r.status_code != 206 or not total.isdigit():
+                return 0, r.headers     # one stream, as for a server without ranges
+            return int(total), r.headers
+
+    def _run(self):
+        try:
+            if self.ranged:
+                self._fetch_ranged()
+            else:
+                self._fetch_single()
+        except BaseException as e:
+            self._error = e
+            if isinstance(e, RemoteFileChanged):
+                self.state_path.unlink(missing_ok=True)     # start over next time
+        finally:
+            with self._cond:
+                self._finished = True
+                if not isinstance(self._error, RemoteFileChanged):
+                    self._save()
+                self._cond.notify_all()
+
+    def _record(self, i: int, count: int):
+        with self._cond:
+            self.done[i] += count
+            if self.progress:
+                self.progress(self.completed, self.size)
+            self._cond.notify_all()
+
+    def _fetch_single(self):
+        with self.session.get(self.url, stream=True, timeout=self.timeout) as r:
+            r.raise_for_status()
+            self.size = int(r.headers.get("content-length", 0))
+            with open(self.piece_path(0), "wb") as f:
+                for chunk in r.iter_content(chunk_size=CHUNK_SIZE):
+                    if self._cancelled:
+                        return
+                    f.write(chunk)
+                    f.flush()
+                    self._record(0, len(chunk))
+            if not self.size:
+                self.size = self.done[0]
+
+    def _fetch_piece(self, i: int):
+        piece_start, piece_end = self.piece(i)
+        for attempt in range(ATTEMPTS):
+            position = piece_start + self.done[i]
+            if position >= piece_end or self._cancelled:
+                return
+            headers = {"Range": f"bytes={position}-{piece_end - 1}"}
+            if self.validator:
+                headers["If-Range"] = self.validator   # full 200 response if the file changed
+            try:
+                with self.session.get(self.url, headers=headers, stream=True, timeout=self.timeout) as r:
+                    if r.status_code != 206:
+                        r.raise_for_status()
+                        # The server ignores ranges, or the file changed (If-Range)
+                        raise RangeNotSupported(f"HTTP {r.status_code} to a range request")
+                    path = self.piece_path(i)
+                    with open(path, "r+b" if path.exists() else "wb") as f:
+                        f.seek(self.done[i])
+                        f.truncate()        # drop bytes written but never recorded
+                        unflushed = 0
+                        for chunk in r.iter_content(chunk_size=CHUNK_SIZE):
+                            if self._cancelled:
+                                return
+                            chunk = chunk[:piece_end - position - unflushed]
+                            f.write(chunk)
+                            unflushed += len(chunk)
+                            if unflushed >= FLUSH_EVERY:
+                                # Only bytes handed to the OS count as done
+                                f.flush()
+                                self._record(i, unflushed)
+                                position += unflushed
+                                unflushed = 0
+                        f.flush()
+                        self._record(i, unflushed)
+                with self._cond:
+                    self._save()
+            except requests.RequestException as e:
+                logging.warning(f'download: piece {i}, attempt {attempt + 1}: {e}')
+                if attempt + 1 < ATTEMPTS:
+                    time.sleep(min(2 ** attempt, 30))
+        if self.remaining(i):
+            self._cancelled = True
+            raise IOError(f"Download of {self.url} kept failing at byte {piece_start + self.done[i]}")
+
+    def _fetch_ranged(self):
+        pending = [i for i in range(len(self.done)) if self.remaining(i)]
+        stop_saving = threading.Event()
+
+        def autosave():
+            while not stop_saving.wait(1.0):
+                with self._cond:
+                    self._save()
+
+        saver = threading.Thread(target=autosave, daemon=True)
+        saver.start()
+        try:
+            # Submitted in file order, so the readable prefix grows steadily
+            with ThreadPoolExecutor(max_workers=self.connections) as pool:
+                futures = [pool.submit(self._fetch_piece, i) for i in pending]
+                try:
+                    for future in futures:
+                        future.result()
+                except BaseException:
+                    self._cancelled = True
+                    raise
+        except RangeNotSupported:
+            self._restart_single()
+            return
+        finally:
+            stop_saving.set()
+            saver.join()
+        if not self._cancelled and self.completed != self.size:
+            raise IOError(f"Download of {self.url} is incomplete ({self.completed}/{self.size} bytes)")
+
+    def _restart_single(self):
+        """Start over in one stream after a 200 reply to a range request."""
+        with self._cond:
+            if self._read_any or self.consumed:
+                raise RemoteFileChanged(f"{self.url} changed while it was being downloaded")
+            logging.info(f'download: {self.url} ignores ranges, downloading in one stream')
+            self.ranged = False
+            self.size = 0
+            self.done = [0]
+            self._cancelled = False
+        self.state_path.unlink(missing_ok=True)
+        self._fetch_single()
+
+    def read(self, offset: int, size: int) -> bytes:
+        """Up to `size` bytes at `offset`, waiting for them to arrive; short only at end of file."""
+        with self._cond:
+            while self._available() < offset + size and not self._finished:
+                self._cond.wait(1.0)
+            if self._available() < offset + size and self._error is not None:
+                raise self._error
+            size = max(0, min(size, self._available() - offset))
+            self._read_any = self._read_any or size > 0
+        out = bytearray()
+        while len(out) < size:
+            i = offset // self.piece_size if self.ranged else 0
+            piece_start, piece_end = self.piece(i)
+            if self._reader is None or self._reader[0] != i:
+                self.close_reader()
+                self._reader = (i, open(self.piece_path(i), "rb"))
+            f = self._reader[1]
+            f.seek(offset - piece_start)
+            data = f.read(min(size - len(out), (piece_end or offset + size) - offset))
+            out += data
+            offset += len(data)
+        return bytes(out)
+
+    def close_reader(self):
+        if self._reader is not None:
+            self._reader[1].close()
+            self._reader = None
+
+    def release(self, offset: int):
+        """Nothing before `offset` will be read again: delete the pieces holding it."""
+        with self._cond:
+            self.consumed = max(self.consumed, offset)
+            self._save()
+        if not self.ranged:
+            return
+        for i in range(self.consumed // self.piece_size):
+            if self._reader is not None and self._reader[0] == i:
+                self.close_reader()
+            self.piece_path(i).unlink(missing_ok=True)
+
+    def cancel(self):
+        """Stop fetching; what arrived so far stays on disk for a later resume."""
+        self._cancelled = True
+        self.join(check=False)
+
+    def join(self, check: bool = True):
+        """Wait for the background fetch; with `check`, raise what made it fail."""
+        if self._thread is not None:
+            self._thread.join()
+        self.close_reader()
+        if check and self._error is not None:
+            raise self._error
+
+    def assemble(self, dest) -> Path:
+        """Concatenate the pieces into `dest` once complete."""
+        dest = Path(dest)
+        part = dest.with_name(dest.name + ".part")
+        with open(part, "wb") as fo:
+            for i in range(len(self.done)):
+                with open(self.piece_path(i), "rb") as fi:
+                    shutil.copyfileobj(fi, fo, CHUNK_SIZE)
+        os.replace(part, dest)
+        return dest
+
+    def cleanup(self):
+        self.close_reader()
+        shutil.rmtree(self.parts_dir, ignore_errors=True)
+
+
+def download(url: str, dest, session: Optional[requests.Session] = None, connections: int = 4,
+             progress: Optional[Progress] = None, piece_size: int = PIECE_SIZE, timeout=TIMEOUT) -> Path:
+    """Fetch `url` into `dest` over up to `connections` parallel HTTP range requests.
+
+    Pieces go to a `dest`.parts directory (see RangedDownload); calling again
+    after an interruption resumes where it stopped.
+    """
+    dest = Path(dest)
+    dl = RangedDownload(url, dest.with_name(dest.name + ".parts"), session=session, connections=connections,
+                        progress=progress, piece_size=piece_size, timeout=timeout).start()
+    dl.join()
+    dl.assemble(dest)
+    dl.cleanup()
+    return dest
@@ -0,0 +1,91 @@
+# src/aikeyboard/latency.py
+import json
+import threading
+import time
+from bisect import bisect_left
+from typing import Dict
+
+
+class LatencyHistogram:
+    """Fixed log-spaced buckets (25% wide, 50 µs to ~60 s); recording is a bisect and an increment."""
+    BOUNDS = [50e-6 * 1.25 ** i for i in range(64)]
+
+    def __init__(self):
+        self.counts = [0] * (len(self.BOUNDS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds: float):
+        self.counts[bisect_left(self.BOUNDS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, q: float) -> float:
+        """Upper bound of the bucket holding the q-th percentile (0..100)."""
+        if not self.count:
+            return 0.0
+        rank = q / 100.0 * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank and n:
+                return min(self.BOUNDS[i], self.max) if i < len(self.BOUNDS) else self.max
+        return self.max
+
+    def to_dict(self) -> dict:
+        ms = 1000.0
+        return {
+            "count": self.count,
+            "mean_ms": self.total / self.count * ms if self.count else 0.0,
+            "p50_ms": self.percentile(50) * ms,
+            "p90_ms": self.percentile(90) * ms,
+            "p99_ms": self.percentile(99) * ms,
+            "max_ms": self.max * ms,
+            "buckets": {f"{b * ms:.3f}": n for b, n in zip(self.BOUNDS + [float('inf')], self.counts) if n},
+        }
+
+
+class _LatencyStats:
+    """Per-stage latency histograms shared by the capture, decode and GUI threads.
+
+    Stages recorded by the application:
+    resample, accept_waveform, endpoint (capture of the closing block to
+    result emitted), command (the same for command mode), signal_hop
+    (worker emit to GUI slot), inject (platform_adapter.write) and
+    end_to_end (capture to text injected).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.histograms: Dict[str, LatencyHistogram] = {}
+        self.since = time.time()
+
+    def record(self, stage: str, seconds: float):
+        hist = self.histograms.get(stage)
+        if hist is None:
+            with self._lock:
+                hist = self.histograms.setdefault(stage, LatencyHistogram())
+        hist.record(seconds)
+
+    def reset(self):
+        with self._lock:
+            self.histograms = {}
+            self.since = time.time()
+
+    def to_dict(self) -> dict:
+        return {
+            "since": self.since,
+            "until": time.time(),
+            "stages": {name: h.to_dict() for name, h in sorted(self.histograms.items())},
+        }
+
+    def dump(self, path) -> str:
+        with open(path, 'w') as fo:
+            json.dump(self.to_dict(), fo, indent=4)
+        return str(path)
+
+
+latency_stats = _LatencyStats()
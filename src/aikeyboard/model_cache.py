@@ -1,18 +1,28 @@
 import json
 import locale
+import logging
 import os
 import shutil
 import sys
-import tempfile
+import threading
 import time
-import zipfile
 from dataclasses import dataclass
 from pathlib import Path
 from typing import List, Optional
 
 import requests
+from PySide6.QtCore import QObject, Signal
 from tqdm import tqdm
 
+from aikeyboard import zipstream
+from aikeyboard.downloader import FileLock, RangedDownload, make_session
+from aikeyboard.model_pins import model_pins, pin_path
+
+MODEL_LIST_URL = "https://alphacephei.com/vosk/models/model-list.json"
+MODEL_LIST_MAX_AGE = 24 * 3600      # seconds before the cached list is revalidated
+REVALIDATE_TIMEOUT = (5, 10)        # connect, read (seconds)
+USAGE_JSON = "usage.json"           # last use and disk size of each local model
+
 
 @dataclass
 class ModelEntry:
@@ -20,6 +30,27 @@ class ModelEntry:
     language: str
     size: str
     download_url: str
+    download_bytes: int = 0         # archive size from the catalog, 0 if not given
+
+
+@dataclass
+class InstalledModel:
+    name: str
+    language: str
+    path: Path
+    disk_bytes: Optional[int]   # None: not measured yet, see installed_models()
+    last_used: float
+
+
+def directory_size(path: Path) -> int:
+    total = 0
+    for root, _dirs, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.lstat(os.path.join(root, name)).st_size
+            except OSError:
+                pass
+    return total
 
 
 def get_default_language():
@@ -33,49 +64,122 @@ def is_recent_file(file_path: Path) -> bool:
         return False   
     current_time = time.time()
     mod_time = file_path.stat().st_mtime
-    return (current_time - mod_time) < 24 * 3600  # 24 hours in seconds
+    return (current_time - mod_time) < MODEL_LIST_MAX_AGE
+
+class _ModelCache(QObject):
+    """Catalog of Vosk models and the local copies of those in use.
 
-class _ModelCache:
-    def __init__(self, app_name="aikeyboard"):
-        if sys.platform == "win32":
+    The catalog is served from the cached model-list.json, however old, and
+    revalidated in the background with a conditional GET. Local copies are
+    kept within app_config.model_cache_quota_mb by evicting the least
+    recently used ones, never the configured model. modelsChanged fires
+    when a new catalog replaces the old one or local copies come and go.
+    """
+    modelsChanged = Signal()
+
+    def __init__(self, app_name="aikeyboard", base: Optional[Path] = None, model_list_url: str = MODEL_LIST_URL,
+                 session: Optional[requests.Session] = None, connections: int = 4):
+        """`base`, `model_list_url` and `session` can point the cache at a local test server."""
+        super().__init__()
+        if base is None and sys.platform == "win32":
             base = Path(os.getenv("LOCALAPPDATA", Path.home() / "AppData" / "Local"))
-        else:
+        elif base is None:
             base = Path(os.getenv("XDG_CACHE_HOME", Path.home() / ".cache"))
-        self.cache_dir = base / app_name / "models"
+        self.cache_dir = Path(base) / app_name / "models"
+        self.model_list_url = model_list_url
+        self.connections = connections          # parallel ranges per download
+        self.session = session or make_session(connections)
         self.cache_dir.mkdir(parents=True, exist_ok=True)
         self.models: List[ModelEntry] = []
         self._selected_model: Optional[str] = None
+        self._revalidation: Optional[threading.Thread] = None
+        self._revalidation_lock = threading.Lock()
         self.refresh()
 
-    def refresh(self):
-        """Fetch and parse the model list from the JSON endpoint."""
-        model_list_json = self.cache_dir / "model-list.json"
-        if is_recent_file(model_list_json):
-            with open(model_list_json) as fi:
-                model_list = json.load(fi)
-        else:
-            try:
-                response = requests.get("https://alphacephei.com/vosk/models/model-list.json")
-                response.raise_for_status()
-                model_list = response.json()
-            except requests.RequestException as e:
-                print(f"Error fetching model list: {e}")
+    @property
+    def model_list_json(self) -> Path:
+        return self.cache_dir / "model-list.json"
+
+    @property
+    def _validators_json(self) -> Path:
+        return self.cache_dir / "model-list.validators.json"
+
+    def refresh(self, wait: bool = False):
+        """Load the cached model list, and revalidate it in the background if it is stale or missing.
+
+        With `wait`, block until the revalidation (if any) is over.
+        """
+        try:
+            with open(self.model_list_json) as fi:
+                self._parse(json.load(fi))
+        except (OSError, ValueError):
+            pass
+        if not is_recent_file(self.model_list_json):
+            self.revalidate()
+        if wait:
+            self.wait_revalidation()
+
+    def revalidate(self):
+        """Start a conditional GET of the model list, unless one is already running."""
+        with self._revalidation_lock:
+            if self._revalidation is not None and self._revalidation.is_alive():
+                return
+            self._revalidation = threading.Thread(target=self._revalidate, name="ModelListRevalidation",
+                                                  daemon=True)
+            self._revalidation.start()
+
+    def wait_revalidation(self, timeout: Optional[float] = None):
+        thread = self._revalidation
+        if thread is not None:
+            thread.join(timeout)
+
+    def _revalidate(self):
+        headers = {}
+        try:
+            with open(self._validators_json) as fi:
+                validators = json.load(fi)
+            if self.model_list_json.exists():
+                if validators.get("etag"):
+                    headers["If-None-Match"] = validators["etag"]
+                if validators.get("last_modified"):
+                    headers["If-Modified-Since"] = validators["last_modified"]
+        except (OSError, ValueError):
+            pass
+        try:
+            response = self.session.get(self.model_list_url, headers=headers, timeout=REVALIDATE_TIMEOUT)
+            if response.status_code == 304:
+                os.utime(self.model_list_json)      # still current: fresh for another MAX_AGE
                 return
-            with open(model_list_json, 'w') as fo:
-                json.dump(model_list, fo, indent=4)
+            response.raise_for_status()
+            model_list = response.json()
+        except (requests.RequestException, ValueError) as e:
+            logging.warning(f'model_cache: cannot refresh the model list, keeping the cached one: {e}')
+            return
 
-        # if we get here model_list is valid
-        self.models.clear()
+        tmp = self.model_list_json.with_name(self.model_list_json.name + ".tmp")
+        with open(tmp, 'w') as fo:
+            json.dump(model_list, fo, indent=4)
+        os.replace(tmp, self.model_list_json)
+        with open(self._validators_json, 'w') as fo:
+            json.dump({"etag": response.headers.get("ETag"),
+                       "last_modified": response.headers.get("Last-Modified")}, fo)
+        self._parse(model_list)
+        self.modelsChanged.emit()
+
+    def _parse(self, model_list):
+        models = []
         for model in model_list:
             name = model.get("name")
             language = model.get("lang")
             size = model.get("type", "unknown")
             download_url = model.get("url")
+            download_bytes = int(model.get("size") or 0)
             obsolete = model.get("obsolete", "false").lower() == 'true'
             if name and language and download_url and not obsolete:
-                self.models.append(ModelEntry(name, language, size, download_url))
+                models.append(ModelEntry(name, language, size, download_url, download_bytes))
         # Optional: sort models by language and size
-        self.models.sort(key=lambda m: (m.language, m.size))
+        models.sort(key=lambda m: (m.language, m.size))
+        self.models = models    # replaced whole, so readers on other threads see either list
 
     def get_languages(self) -> List[str]:
         return sorted({m.language for m in self.models})
@@ -89,14 +193,148 @@ class _ModelCache:
                 return m
         return None
 
+    def get_models_for_languages(self, langs: List[str], preferred: Optional[str] = None) -> List[ModelEntry]:
+        """One model per language: `preferred` where it matches, else the smallest one.
+
+        Smallest means catalog type "small" if there is one, then the
+        smallest archive; obsolete models are already left out of the catalog.
+        """
+        if not self.models:
+            self.wait_revalidation()    # nothing cached yet
+        chosen = []
+        for lang in langs:
+            models = self.get_models_for_language(lang)
+            if not models:
+                raise ValueError(f"No model for language '{lang}'")
+            smallest = min(models, key=lambda m: (m.size != "small", m.download_bytes or float("inf")))
+            chosen.append(next((m for m in models if m.name == preferred), smallest))
+        return chosen
+
     def selected_model_entry(self) -> Optional[ModelEntry]:
         return self.get_model_by_name(self._selected_model) if self._selected_model else None
 
 
-    def ensure_model(self) -> str:
+    def _usage_lock(self) -> FileLock:
+        return FileLock(self.cache_dir / "usage.lock")
+
+    def _load_usage(self) -> dict:
+        try:
+            with open(self.cache_dir / USAGE_JSON) as fi:
+                return json.load(fi)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_usage(self, usage: dict):
+        path = self.cache_dir / USAGE_JSON
+        tmp = path.with_name(path.name + ".tmp")
+        with open(tmp, 'w') as fo:
+            json.dump(usage, fo, indent=4)
+        os.replace(tmp, path)
+
+    def mark_used(self, model_path: Path):
+        """Record that the model at `model_path` was just used, measuring it the first time."""
+        key = model_path.relative_to(self.cache_dir).as_posix()
+        with self._usage_lock():
+            usage = self._load_usage()
+            entry = usage.setdefault(key, {})
+            entry["last_used"] = time.time()
+            if "disk_bytes" not in entry:
+                entry["disk_bytes"] = directory_size(model_path)
+            self._save_usage(usage)
+
+    def installed_models(self, measure: bool = True) -> List[InstalledModel]:
+        """Models present on disk, least recently used first.
+
+        Sizes come from usage.json. Models without one (installed before it
+        was kept) are measured and recorded if `measure` is set, otherwise
+        their disk_bytes is None: cheap enough for the GUI thread.
+        """
+        usage = self._load_usage()
+        installed = []
+        measured = {}
+        for lang_dir in self.cache_dir.iterdir():
+            if not lang_dir.is_dir():
+                continue
+            for path in lang_dir.iterdir():
+                # Skip download pieces and extraction staging
+                if not path.is_dir() or path.name.startswith(".") or path.suffix == ".parts":
+                    continue
+                key = path.relative_to(self.cache_dir).as_posix()
+                entry = usage.get(key, {})
+                disk_bytes = entry.get("disk_bytes")
+                if disk_bytes is None and measure:
+                    disk_bytes = measured[key] = directory_size(path)
+                installed.append(InstalledModel(path.name, lang_dir.name, path, disk_bytes,
+                                                entry.get("last_used", path.stat().st_mtime)))
+        if measured:
+            with self._usage_lock():
+                usage = self._load_usage()
+                for key, disk_bytes in measured.items():
+                    usage.setdefault(key, {}).setdefault("disk_bytes", disk_bytes)
+                self._save_usage(usage)
+        installed.sort(key=lambda m: m.last_used)
+        return installed
+
+    def quota_bytes(self) -> int:
+        """0 means unlimited."""
         from aikeyboard.config import app_config
+        return int(app_config.model_cache_quota_mb) * 1024 * 1024
 
-        model_name = str(app_config.model)
+    def evict(self, incoming: int = 0, keep=()) -> List[str]:
+        """Delete least recently used models until `incoming` more bytes fit in the quota.
+
+        The configured model, the names in `keep` and models pinned by any
+        process (see model_pins) are never deleted, even if that leaves the
+        cache over quota. Returns the evicted names.
+        """
+        quota = self.quota_bytes()
+        if quota <= 0:
+            return []
+        from aikeyboard.config import app_config
+        pinned = set(keep) | {str(app_config.model)}
+        installed = self.installed_models()
+        excess = sum(m.disk_bytes for m in installed) + incoming - quota
+        evicted = []
+        for model in installed:
+            if excess <= 0:
+                break
+            if model.name in pinned or model_pins.is_pinned(model.path):
+                continue
+            try:
+                # Not while another process is fetching it or has it pinned
+                with FileLock(model.path.parent / f"{model.name}.lock", timeout=0), \
+                        FileLock(pin_path(model.path), timeout=0):
+                    shutil.rmtree(model.path)
+            except TimeoutError:
+                continue
+            logging.info(f'model_cache: evicted {model.name} ({model.disk_bytes} bytes, '
+                         f'last used {time.ctime(model.last_used)})')
+            excess -= model.disk_bytes
+            evicted.append(model.name)
+        if evicted:
+            with self._usage_lock():
+                usage = self._load_usage()
+                for model in installed:
+                    if model.name in evicted:
+                        usage.pop(model.path.relative_to(self.cache_dir).as_posix(), None)
+                self._save_usage(usage)
+            self.modelsChanged.emit()
+        if excess > 0:
+            logging.warning(f'model_cache: {excess} bytes over quota, only pinned models are left')
+        return evicted
+
+    def ensure_model(self, model_name: Optional[str] = None, pin: bool = False) -> str:
+        """Path of the model (default: the configured one), downloading it if needed.
+
+        With `pin` the model is also pinned against eviction; the caller
+        releases it with model_pins.unpin() once done with it.
+        """
+        if model_name is None:
+            from aikeyboard.config import app_config
+            model_name = str(app_config.model)
+
+        if not self.models or (model_name and self.get_model_by_name(model_name) is None):
+            self.wait_revalidation()    # nothing cached yet, or the cached list predates the model
 
         # Select from known models
         if not model_name:
@@ -104,44 +342,78 @@ class _ModelCache:
             models = self.get_models_for_language(lang)
             if not models:
                 raise ValueError(f"No default model for language '{lang}'")
-            model_name = models[0].name
-            model_url = models[0].download_url
+            model = models[0]
+            model_name = model.name
         else:
             model = self.get_model_by_name(model_name)
             if model is None:
                 raise ValueError(f"Model with name '{model_name}' is not known")
-            model_url = model.download_url
             lang = model.language
 
         model_path = self.cache_dir / lang / model_name
+        if not pin:
+            return self._ensure(model, model_path)
+        # Pinned before the existence check, so it cannot be evicted in between
+        model_pins.pin(model_path)
+        try:
+            return self._ensure(model, model_path)
+        except BaseException:
+            model_pins.unpin(model_path)
+            raise
+
+    def _ensure(self, model: ModelEntry, model_path: Path) -> str:
+        model_name, model_url = model.name, model.download_url
         if model_path.exists():
+            self.mark_used(model_path)
             return str(model_path)
 
-        # Download and unzip
-        lang_dir = self.cache_dir / lang
+        # Download and unzip at the same time
+        lang_dir = model_path.parent
         lang_dir.mkdir(parents=True, exist_ok=True)
-        zip_path = lang_dir / f"{model_name}.zip"
-
-        print(f"Downloading {model_name} model...")
-        with requests.get(model_url, stream=True) as r:
-            r.raise_for_status()
-            total = int(r.headers.get("content-length", 0))
-            with open(zip_path, "wb") as f, tqdm(
-                total=total, unit="B", unit_scale=True, desc=model_name
-            ) as pbar:
-                for chunk in r.iter_content(chunk_size=8192):
-                    f.write(chunk)
-                    pbar.update(len(chunk))
-
-        print(f"Extracting model to {model_path}...")
-        with zipfile.ZipFile(zip_path, "r") as zip_ref:
-            tmp_dir = tempfile.mkdtemp(dir=lang_dir)
-            zip_ref.extractall(tmp_dir)
-            extracted_path = Path(tmp_dir) / model_name
-            shutil.move(str(extracted_path), str(model_path))
-            shutil.rmtree(tmp_dir)
-
-        zip_path.unlink()
+
+        # Another process (batch worker, second instance) may be fetching the same model
+        with FileLock(lang_dir / f"{model_name}.lock"):
+            if model_path.exists():
+                self.mark_used(model_path)
+                return str(model_path)
+
+            # Make room first; the catalog size is that of the archive, close to the extracted one
+            self.evict(incoming=model.download_bytes, keep={model_name})
+
+            # Members are extracted as soon as their bytes arrive, and the
+            # pieces they came from deleted: the archive is never on disk whole
+            staging = lang_dir / f".{model_name}.partial"
+            print(f"Downloading and extracting {model_name} model...")
+            with tqdm(unit="B", unit_scale=True, desc=model_name) as pbar:
+                def progress(done, total):
+                    pbar.total = total
+                    pbar.update(done - pbar.n)
+                dl = RangedDownload(model_url, lang_dir / f"{model_name}.zip.parts", session=self.session,
+                                    connections=self.connections, progress=progress).start()
+                if not dl.resumed:
+                    shutil.rmtree(staging, ignore_errors=True)
+                try:
+                    try:
+                        zipstream.extract(dl.read, staging, offset=dl.consumed, member_done=dl.release)
+                    except zipstream.NotStreamable as e:
+                        # The rest comes out of the central directory once it has arrived
+                        logging.info(f'model_cache: {e}, extracting the rest after the download')
+                        dl.join()
+                        zipstream.extract_indexed(dl.read, dl.size, staging, offset=e.offset)
+                    dl.join()
+                except BaseException:
+                    dl.cancel()     # keep what arrived for the next attempt
+                    raise
+
+            extracted_path = staging / model_name
+            if not extracted_path.is_dir():
+                raise ValueError(f"Archive for '{model_name}' has no {model_name}/ directory")
+            os.replace(extracted_path, model_path)      # publish atomically
+            shutil.rmtree(staging)
+            dl.cleanup()
+            self.mark_used(model_path)
+        self.evict(keep={model_name})      # with the measured size
+        self.modelsChanged.emit()
         return str(model_path)
 
 model_cache = _ModelCache()
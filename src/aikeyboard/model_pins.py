@@ -0,0 +1,56 @@
+# src/aikeyboard/model_pins.py
+"""Local models in use, which the model cache must not evict.
+
+A pin is a shared lock on <lang>/<name>.pin next to the model directory;
+eviction needs the exclusive lock, so pins taken by other processes
+(batch workers, a second instance) count too and vanish with their
+holder. On Windows, where FileLock has no shared mode, only pins taken
+in this process are seen.
+"""
+import threading
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+from aikeyboard.downloader import FileLock
+
+
+def pin_path(model_path) -> Path:
+    model_path = Path(model_path)
+    return model_path.parent / f"{model_path.name}.pin"
+
+
+class _ModelPins:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pins: Dict[str, Tuple[int, FileLock]] = {}
+
+    def pin(self, model_path):
+        """Keep `model_path` from being evicted until a matching unpin(); calls nest."""
+        key = str(model_path)
+        with self._lock:
+            count, lock = self._pins.get(key, (0, None))
+            if lock is None:
+                pin_path(model_path).parent.mkdir(parents=True, exist_ok=True)
+                # Blocks only while an eviction of this very model is deleting it
+                lock = FileLock(pin_path(model_path), shared=True).__enter__()
+            self._pins[key] = (count + 1, lock)
+
+    def unpin(self, model_path):
+        key = str(model_path)
+        with self._lock:
+            count, lock = self._pins[key]
+            if count > 1:
+                self._pins[key] = (count - 1, lock)
+            else:
+                del self._pins[key]
+                lock.__exit__(None, None, None)
+
+    def is_pinned(self, model_path) -> bool:
+        """Pinned by this process."""
+        return str(model_path) in self._pins
+
+    def pinned(self) -> List[str]:
+        return list(self._pins)
+
+
+model_pins = _ModelPins()
@@ -0,0 +1,123 @@
+# src/aikeyboard/model_pool.py
+import logging
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from vosk import KaldiRecognizer, Model
+
+from aikeyboard.model_pins import model_pins
+
+
+def _dir_size(path: str) -> int:
+    return sum(f.stat().st_size for f in Path(path).rglob('*') if f.is_file())
+
+
+class _ModelPool:
+    """Process-wide loaded Vosk models and idle recognizers.
+
+    A model is loaded once per path and shared by every worker; recognizers
+    are handed back with release_recognizer(), reset and reused; grammar
+    restricted recognizers are pooled separately but share the model. Loaded
+    models form an LRU bounded by `budget_bytes`, estimated from their size
+    on disk; models with recognizers in use are never evicted. Loaded models
+    are pinned so the model cache does not delete them from disk.
+    """
+    DEFAULT_BUDGET = 2 * 1024 ** 3
+
+    def __init__(self, budget_bytes: int = DEFAULT_BUDGET):
+        self.budget_bytes = budget_bytes
+        self._lock = threading.Lock()
+        self._load_locks: Dict[str, threading.Lock] = {}
+        self._models: 'OrderedDict[str, Model]' = OrderedDict()
+        self._sizes: Dict[str, int] = {}
+        self._in_use: Dict[str, int] = {}
+        self._idle: Dict[Tuple[str, int, Optional[str]], List[KaldiRecognizer]] = {}
+        self._keys: Dict[int, Tuple[str, int, Optional[str]]] = {}
+
+    def get_model(self, model_path: str) -> Model:
+        with self._lock:
+            model = self._models.get(model_path)
+            if model is not None:
+                self._models.move_to_end(model_path)
+                return model
+            load_lock = self._load_locks.setdefault(model_path, threading.Lock())
+        # Load outside the pool lock so other models stay available meanwhile
+        with load_lock:
+            model = self._models.get(model_path)
+            if model is None:
+                logging.info(f'ModelPool: loading {model_path}')
+                model_pins.pin(model_path)
+                size = _dir_size(model_path)
+                try:
+                    model = Model(model_path)
+                except BaseException:
+                    model_pins.unpin(model_path)
+                    raise
+                with self._lock:
+                    self._models[model_path] = model
+                    self._sizes[model_path] = size
+                    self._evict()
+        return model
+
+    def _evict(self):
+        """Drop least recently used idle models until the budget fits (lock held)."""
+        total = sum(self._sizes.values())
+        for path in list(self._models)[:-1]:
+            if total <= self.budget_bytes:
+                break
+            if self._in_use.get(path):
+                continue
+            logging.info(f'ModelPool: evicting {path}')
+            del self._models[path]
+            total -= self._sizes.pop(path)
+            model_pins.unpin(path)
+            for key in [k for k in self._idle if k[0] == path]:
+                for rec in self._idle.pop(key):
+                    self._keys.pop(id(rec), None)
+
+    def acquire_recognizer(self, model_path: str, rate: int, grammar: Optional[str] = None) -> KaldiRecognizer:
+        """Idle or new recognizer; `grammar` is a JSON list of phrases restricting the vocabulary.
+
+        Only models with a dynamic graph (most "small" ones) honour a grammar,
+        the others log a warning and decode freely.
+        """
+        key = (model_path, rate, grammar)
+        with self._lock:
+            idle = self._idle.get(key)
+            if idle:
+                self._in_use[model_path] = self._in_use.get(model_path, 0) + 1
+                if model_path in self._models:
+                    self._models.move_to_end(model_path)
+                return idle.pop()
+        model = self.get_model(model_path)
+        rec = KaldiRecognizer(model, rate, grammar) if grammar else KaldiRecognizer(model, rate)
+        with self._lock:
+            self._keys[id(rec)] = key
+            self._in_use[model_path] = self._in_use.get(model_path, 0) + 1
+        return rec
+
+    def preload(self, model_path: str, rate: int = 16000, warmup_seconds: float = 1.0):
+        """Load a model and run a recognizer over silence so the first real decode is fast."""
+        rec = self.acquire_recognizer(model_path, rate)
+        try:
+            rec.AcceptWaveform(bytes(2 * int(rate * warmup_seconds)))
+            rec.FinalResult()
+        finally:
+            self.release_recognizer(rec)
+
+    def release_recognizer(self, rec: KaldiRecognizer):
+        rec.Reset()
+        with self._lock:
+            key = self._keys.get(id(rec))
+            if key is not None:
+                self._in_use[key[0]] -= 1
+                if key[0] in self._models:
+                    self._idle.setdefault(key, []).append(rec)
+                    self._evict()
+                else:
+                    self._keys.pop(id(rec))
+
+
+model_pool = _ModelPool()
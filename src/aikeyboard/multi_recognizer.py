@@ -0,0 +1,138 @@
+# src/aikeyboard/multi_recognizer.py
+import json
+import logging
+import multiprocessing
+import time
+from multiprocessing.connection import wait
+from typing import List, Tuple
+
+# Single-byte opcodes prefixed to every message sent to a decoder process
+_AUDIO = b'A'
+_FINAL = b'F'
+_RESET = b'R'
+_QUIT = b'Q'
+
+
+def _score(result: dict) -> Tuple[str, float, int]:
+    words = result.get("result", [])
+    confidence = sum(w.get("conf", 0.0) for w in words)
+    return result.get("text", "").strip(), confidence, len(words)
+
+
+def _decoder_main(conn, model_path: str, rate: int):
+    """Decoder process: one recognizer, audio in, (text, confidence) out per utterance."""
+    from vosk import KaldiRecognizer, Model, SetLogLevel
+    SetLogLevel(-1)
+    rec = KaldiRecognizer(Model(model_path), rate)
+    rec.SetWords(True)
+    texts: List[str] = []
+    confidence, words = 0.0, 0
+    conn.send(None)     # ready
+    while True:
+        msg = conn.recv_bytes()
+        op = msg[:1]
+        if op == _AUDIO:
+            if rec.AcceptWaveform(msg[1:]):
+                text, conf, n = _score(json.loads(rec.Result()))
+                if text:
+                    texts.append(text)
+                    confidence, words = confidence + conf, words + n
+        elif op == _FINAL:
+            text, conf, n = _score(json.loads(rec.FinalResult()))
+            if text:
+                texts.append(text)
+                confidence, words = confidence + conf, words + n
+            conn.send((" ".join(texts), confidence / words if words else 0.0))
+            texts, confidence, words = [], 0.0, 0
+        elif op == _RESET:
+            rec.Reset()
+            texts, confidence, words = [], 0.0, 0
+        elif op == _QUIT:
+            break
+    conn.close()
+
+
+class MultiLanguageRecognizer:
+    """Fans audio out to one decoder process per model and keeps the most confident result.
+
+    Quacks like KaldiRecognizer for SpeechWorker, but never detects endpoints
+    itself: AcceptWaveform() always returns False and the caller decides when
+    an utterance ends (the VAD) by calling FinalResult(), which waits at most
+    `timeout` seconds for all decoders together.
+    """
+
+    def __init__(self, model_paths: List[str], rate: int = 16000, timeout: float = 2.0):
+        self.model_paths = model_paths
+        self.timeout = timeout
+        ctx = multiprocessing.get_context('spawn')
+        self._conns = []
+        self._procs = []
+        for path in model_paths:
+            parent, child = ctx.Pipe()
+            proc = ctx.Process(target=_decoder_main, args=(child, path, rate), daemon=True)
+            proc.start()
+            child.close()
+            self._conns.append(parent)
+            self._procs.append(proc)
+        for path, conn in zip(model_paths, self._conns):
+            if not conn.poll(120):
+                raise RuntimeError(f"Decoder process for {path} did not start")
+            conn.recv()
+        logging.info(f'MultiLanguageRecognizer: {len(model_paths)} decoder processes ready')
+
+    def _broadcast(self, msg: bytes):
+        for conn in self._conns:
+            conn.send_bytes(msg)
+
+    def AcceptWaveform(self, data: bytes) -> bool:
+        self._broadcast(_AUDIO + data)
+        return False
+
+    def PartialResult(self) -> str:
+        return '{"partial": ""}'
+
+    def FinalResult(self) -> str:
+        for conn in self._conns:
+            while conn.poll():      # late answers to an earlier, timed out request
+                conn.recv()
+        self._broadcast(_FINAL)
+        best_text, best_conf, best_path = "", -1.0, None
+        # Answers are collected as they come, under one deadline for all decoders
+        pending = dict(zip(self._conns, self.model_paths))
+        deadline = time.monotonic() + self.timeout
+        while pending:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            for conn in wait(list(pending), remaining):
+                path = pending.pop(conn)
+                try:
+                    text, conf = conn.recv()
+                except (EOFError, OSError):
+                    logging.warning(f'MultiLanguageRecognizer: decoder process for {path} is gone')
+                    continue
+                if text and conf > best_conf:
+                    best_text, best_conf, best_path = text, conf, path
+        for path in pending.values():
+            logging.warning(f'MultiLanguageRecognizer: no result from {path} within {self.timeout} s')
+        if best_path:
+            logging.debug(f'MultiLanguageRecognizer: picked {best_path} ({best_conf:.2f})')
+        return json.dumps({"text": best_text, "confidence": max(best_conf, 0.0), "model": best_path})
+
+    Result = FinalResult
+
+    def Reset(self):
+        self._broadcast(_RESET)
+
+    def close(self):
+        for conn in self._conns:
+            try:
+                conn.send_bytes(_QUIT)
+            except OSError:
+                pass
+        for proc in self._procs:
+            proc.join(timeout=2)
+            if proc.is_alive():
+                proc.terminate()
+        for conn in self._conns:
+            conn.close()
@@ -25,6 +25,10 @@ class PlatformManager:
     def write(self, text):
         self.impl.write(text)
 
+    def press_key(self, key, count=1):
+        """Press a named key ("BackSpace", "Return" or "Tab") `count` times."""
+        self.impl.press_key(key, count)
+
     def setup_tray_integration(self):
         self.impl.setup_tray_integration()
 
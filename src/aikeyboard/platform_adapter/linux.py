@@ -36,6 +36,14 @@ class LinuxAdapter:
         except Exception as e:
             logging.error(f"Input error: {e}")
 
+    def press_key(self, key, count=1):
+        if not self.xdotool_available or count < 1:
+            return
+        try:
+            subprocess.run(['xdotool', 'key', '--delay', '20', '--'] + [key] * count, check=True)
+        except Exception as e:
+            logging.error(f"Input error: {e}")
+
     def setup_tray_integration(self):
         pass
 
@@ -6,6 +6,8 @@ from PySide6.QtWidgets import QApplication
 
 
 class MacAdapter:
+    KEY_CODES = {"BackSpace": 51, "Return": 36, "Tab": 48}
+
     def setup(self):
         pass
 
@@ -15,6 +17,15 @@ class MacAdapter:
     def write(self, text):
         subprocess.run(["osascript", "-e", f'tell application "System Events" to keystroke "{text}"'])
 
+    def press_key(self, key, count=1):
+        code = self.KEY_CODES[key]
+        script = (f'tell application "System Events"\n'
+                  f'    repeat {count} times\n'
+                  f'        key code {code}\n'
+                  f'    end repeat\n'
+                  f'end tell')
+        subprocess.run(["osascript", "-e", script])
+
     def setup_tray_integration(self):
         pass
 
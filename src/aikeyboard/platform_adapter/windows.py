@@ -16,6 +16,7 @@ INPUT_KEYBOARD = 1
 KEYEVENTF_UNICODE = 0x0004
 KEYEVENTF_KEYUP = 0x0002
 EXTRAINFO_MAGIC = 0xABAD1DEA  # Magic number to identify our inputs
+VIRTUAL_KEYS = {"BackSpace": 0x08, "Tab": 0x09, "Return": 0x0D}
 
 # Structures
 class KEYBDINPUT(ctypes.Structure):
@@ -144,6 +145,18 @@ class WindowsAdapter:
                     log.error(f"\nFailed to send character '{char}' after {max_retries} retries")
         inject(text)
 
+    def press_key(self, key: str, count: int = 1, key_delay=0.02):
+        vk = VIRTUAL_KEYS[key]
+        extra_info = ctypes.pointer(wintypes.ULONG(EXTRAINFO_MAGIC))
+        inputs = (INPUT * 2)()
+        inputs[0].type = INPUT_KEYBOARD
+        inputs[0].ki = KEYBDINPUT(wVk=vk, wScan=0, dwFlags=0, time=0, dwExtraInfo=extra_info)
+        inputs[1].type = INPUT_KEYBOARD
+        inputs[1].ki = KEYBDINPUT(wVk=vk, wScan=0, dwFlags=KEYEVENTF_KEYUP, time=0, dwExtraInfo=extra_info)
+        for _ in range(count):
+            ctypes.windll.user32.SendInput(2, ctypes.byref(inputs), ctypes.sizeof(INPUT))
+            time.sleep(key_delay)
+
 
 if __name__ == "__main__":
     LoggingConfig.configure()
@@ -0,0 +1,96 @@
+# src/aikeyboard/resampler.py
+from math import gcd
+
+import numpy as np
+
+
+class StreamResampler:
+    """Polyphase int16 resampler carrying filter state across blocks.
+
+    The anti-aliasing filter is designed once (Kaiser-windowed sinc, same
+    parameters as scipy's resample_poly) and split into polyphase branches.
+    Every buffer used by process() is preallocated, so the hot path does not
+    allocate unless a block larger than `max_block` shows up.
+    """
+
+    def __init__(self, input_rate: int, output_rate: int = 16000, max_block: int = 4096):
+        self.input_rate = int(input_rate)
+        self.output_rate = int(output_rate)
+        g = gcd(self.input_rate, self.output_rate)
+        self.up = self.output_rate // g
+        self.down = self.input_rate // g
+
+        # Low-pass prototype at the upsampled rate
+        max_rate = max(self.up, self.down)
+        half_len = 10 * max_rate
+        n_taps = 2 * half_len + 1
+        t = np.arange(n_taps) - half_len
+        taps = np.sinc(t / max_rate) * np.kaiser(n_taps, 5.0)
+        taps *= self.up / taps.sum()
+
+        # Polyphase matrix, branches reversed so that a sliding window over
+        # the input can be used directly in the dot product
+        self.taps_per_phase = -(-n_taps // self.up)
+        padded = np.zeros(self.taps_per_phase * self.up)
+        padded[:n_taps] = taps
+        self._phases = np.ascontiguousarray(
+            padded.reshape(self.taps_per_phase, self.up).T[:, ::-1], dtype=np.float32)
+
+        self._u = 0  # position of the next output sample, in upsampled units
+        self._allocate(max_block)
+
+    def _allocate(self, max_block: int):
+        k = self.taps_per_phase
+        history = self._x[:k - 1].copy() if hasattr(self, '_x') else np.zeros(k - 1, dtype=np.float32)
+        self.max_block = max_block
+        max_out = max_block * self.up // self.down + 1
+        self._x = np.zeros(k - 1 + max_block, dtype=np.float32)
+        self._x[:k - 1] = history
+        self._steps = np.arange(max_out, dtype=np.int64) * self.down
+        self._pos = np.empty(max_out, dtype=np.int64)
+        self._idx = np.empty(max_out, dtype=np.int64)
+        self._phase = np.empty(max_out, dtype=np.int64)
+        self._win = np.empty((max_out, k), dtype=np.float32)
+        self._coef = np.empty((max_out, k), dtype=np.float32)
+        self._acc = np.empty(max_out, dtype=np.float32)
+        self._out = np.empty(max_out, dtype=np.int16)
+
+    def reset(self):
+        """Forget filter history (e.g. after the stream was stopped)."""
+        self._x[:self.taps_per_phase - 1] = 0
+        self._u = 0
+
+    def process(self, data) -> np.ndarray:
+        """Resample one block of int16 samples (bytes or ndarray).
+
+        Returns a view into an internal buffer, valid until the next call.
+        """
+        block = np.frombuffer(data, dtype=np.int16) if isinstance(data, (bytes, bytearray, memoryview)) else data
+        n_in = len(block)
+        if n_in > self.max_block:
+            self._allocate(n_in)
+        k = self.taps_per_phase
+        x = self._x
+        x[k - 1:k - 1 + n_in] = block
+
+        span = n_in * self.up
+        n_out = -(-(span - self._u) // self.down) if self._u < span else 0
+        if n_out:
+            pos = np.add(self._steps[:n_out], self._u, out=self._pos[:n_out])
+            idx, phase = self._idx[:n_out], self._phase[:n_out]
+            np.floor_divide(pos, self.up, out=idx)
+            np.remainder(pos, self.up, out=phase)
+            windows = np.lib.stride_tricks.sliding_window_view(x[:k - 1 + n_in], k)
+            win, coef, acc = self._win[:n_out], self._coef[:n_out], self._acc[:n_out]
+            np.take(windows, idx, axis=0, out=win)
+            np.take(self._phases, phase, axis=0, out=coef)
+            np.multiply(win, coef, out=win)
+            np.sum(win, axis=1, out=acc)
+            np.rint(acc, out=acc)
+            np.clip(acc, -32768, 32767, out=acc)
+            self._out[:n_out] = acc
+        self._u += n_out * self.down - span
+
+        # Keep the last k-1 input samples as history for the next block
+        x[:k - 1] = x[n_in:n_in + k - 1]
+        return self._out[:n_out]
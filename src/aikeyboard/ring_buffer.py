@@ -0,0 +1,112 @@
+# src/aikeyboard/ring_buffer.py
+import threading
+import time
+
+import numpy as np
+
+
+class AudioRingBuffer:
+    """Preallocated ring of audio samples.
+
+    Used either as a history that overwrites the oldest data (append/latest)
+    or as a single-producer/single-consumer FIFO (put/get). The FIFO needs
+    no lock: the producer only advances `written`, the consumer only
+    advances `read_pos`. Positions are absolute sample counts; the slot for
+    position p is p % capacity.
+    """
+
+    def __init__(self, capacity: int, dtype=np.int16):
+        self.capacity = int(capacity)
+        self._buf = np.zeros(self.capacity, dtype=dtype)
+        self.written = 0
+        self.read_pos = 0
+        self.overruns = 0           # put() calls that did not fit
+        self.dropped = 0            # samples lost to overruns
+        self.input_overflows = 0    # overflows reported by the audio driver
+        self.last_put_time = 0.0    # time.monotonic() of the latest put()
+        self._data_ready = threading.Event()
+
+    def __len__(self) -> int:
+        return min(self.written, self.capacity)
+
+    def clear(self):
+        """Empty the buffer; only call while the producer is stopped."""
+        self.written = 0
+        self.read_pos = 0
+
+    def _copy_in(self, pos: int, samples: np.ndarray):
+        start = pos % self.capacity
+        first = min(len(samples), self.capacity - start)
+        self._buf[start:start + first] = samples[:first]
+        if first < len(samples):
+            self._buf[:len(samples) - first] = samples[first:]
+
+    def _copy_out(self, pos: int, out: np.ndarray):
+        start = pos % self.capacity
+        first = min(len(out), self.capacity - start)
+        out[:first] = self._buf[start:start + first]
+        if first < len(out):
+            out[first:] = self._buf[:len(out) - first]
+
+    def append(self, samples: np.ndarray):
+        """Write samples, overwriting the oldest ones when full."""
+        n = len(samples)
+        if n > self.capacity:
+            samples = samples[-self.capacity:]
+        self._copy_in(self.written + n - len(samples), samples)
+        self.written += n
+
+    def latest(self, count=None, out=None) -> np.ndarray:
+        """Copy of the most recent `count` samples (default: all), oldest first."""
+        available = len(self)
+        count = available if count is None else min(count, available)
+        if out is None:
+            out = np.empty(count, dtype=self._buf.dtype)
+        else:
+            out = out[:count]
+        self._copy_out(self.written - count, out)
+        return out
+
+    def available(self) -> int:
+        """Samples written but not yet consumed."""
+        return self.written - self.read_pos
+
+    @property
+    def fill_level(self) -> float:
+        return self.available() / self.capacity
+
+    def put(self, samples: np.ndarray) -> int:
+        """Producer side: enqueue samples, dropping what does not fit."""
+        n = min(len(samples), self.capacity - self.available())
+        if n < len(samples):
+            self.overruns += 1
+            self.dropped += len(samples) - n
+        if n:
+            self._copy_in(self.written, samples[:n])
+            self.written += n
+            self.last_put_time = time.monotonic()
+            self._data_ready.set()
+        return n
+
+    def get(self, count: int, out=None) -> np.ndarray:
+        """Consumer side: dequeue up to `count` samples."""
+        count = min(count, self.available())
+        if out is None:
+            out = np.empty(count, dtype=self._buf.dtype)
+        else:
+            out = out[:count]
+        self._copy_out(self.read_pos, out)
+        self.read_pos += count
+        return out
+
+    def wait(self, count: int, timeout: float) -> bool:
+        """Consumer side: block until `count` samples are available or timeout expires."""
+        deadline = time.monotonic() + timeout
+        while self.available() < count:
+            self._data_ready.clear()
+            if self.available() >= count:
+                break
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not self._data_ready.wait(remaining):
+                return self.available() >= count
+        return True
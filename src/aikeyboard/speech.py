@@ -1,33 +1,94 @@
 # src/aikeyboard/speech.py
 import json
 import logging
+import threading
 import time
-from typing import Optional
+from collections import deque
+from typing import List, Optional
 
 import numpy as np
-from PySide6.QtCore import Property, QObject, QThread, Signal, Slot
-from scipy.signal import resample_poly
-from vosk import KaldiRecognizer, Model
+from PySide6.QtCore import SIGNAL, Property, QObject, QThread, Signal, Slot
 
+from aikeyboard.block_controller import BlockSizeController
+from aikeyboard.decoder_process import RemoteRecognizer
+from aikeyboard.latency import latency_stats
 from aikeyboard.model_cache import model_cache
+from aikeyboard.model_pins import model_pins
+from aikeyboard.model_pool import model_pool
+from aikeyboard.multi_recognizer import MultiLanguageRecognizer
 from aikeyboard.device_manager import device_manager
+from aikeyboard.resampler import StreamResampler
+from aikeyboard.ring_buffer import AudioRingBuffer
+from aikeyboard.tracing import tracer
+from aikeyboard.vad import VoiceActivityGate
 
 
 class SpeechWorker(QObject):
+    CALLBACK_FRAMES = 1024          # PortAudio buffer size in callback mode
+    RING_SECONDS = 4.0              # capture backlog tolerated before dropping audio
+    FLIGHT_RECORDER_SECONDS = 30.0  # raw audio kept for request_flight_dump()
+
     state_changed = Signal(str)  # "listening", "processing", "idle"
     partial_result = Signal(str)
     recognized = Signal(str)     # Signal emitted when text is recognized
     finished = Signal()          # Signal emitted when thread finishes
     error = Signal(str)          # Signal emitted on errors
+    flight_recording_saved = Signal(str)
+    command = Signal(str)        # phrase recognized in command mode
 
-    def __init__(self, device_index=None):
+    def __init__(self, device_index=None, use_vad=True, partial_interval=0.25, languages=None,
+                 out_of_process=False, min_block=0.064, max_block=0.512, commands=None,
+                 model_name: Optional[str] = None):
         super().__init__()
         self.device_index: Optional[int] = device_index
+        self.model_name = model_name                # None: the configured model
+        self.use_vad = use_vad
+        self.languages: List[str] = languages or []  # two or more: parallel multi-language mode
+        self.out_of_process = out_of_process        # decode in a subprocess fed through shared memory
+        self.partial_interval = partial_interval  # seconds between PartialResult() calls
+        self.min_block = min_block                # decoder block bounds in seconds, see BlockSizeController
+        self.max_block = max_block
+        self.commands: List[str] = commands or []   # phrases accepted in command mode
+        self.command_mode = False
+        self._mode_changed = False
+        self._grammar: Optional[str] = None         # grammar of the recognizer in use, None when dictating
+        self._last_partial = ""
+        self._last_partial_time = 0.0
+        self.model_path: Optional[str] = None
+        self._pinned: List[str] = []        # models kept from cache eviction while listening
+        self._pending_model: Optional[str] = None
+        self._utterance_open = False
+        self._captured_at = 0.0     # monotonic capture time of the last sample of the current block
+        self.emitted_at = deque(maxlen=32)  # (emit time, capture time) per recognized signal
+        self._recorder: Optional[AudioRingBuffer] = None
+        self._recorder_rate = 0
+        self._events = deque(maxlen=512)    # (time, kind, text) for the flight recorder
+        self._dump_path: Optional[str] = None
         self._stop_requested = False
         self._paused = False
+        self._wakeup = threading.Condition()
+        self._ring: Optional[AudioRingBuffer] = None
+        self._remote: Optional[RemoteRecognizer] = None
+        self._last_overruns = 0
         self.main_loop_active = False
         self._state = "idle"
 
+    @property
+    def overruns(self) -> int:
+        """Capture buffers dropped because the decoder fell behind, here or in the decoder process."""
+        overruns = self._ring.overruns if self._ring else 0
+        return overruns + (self._remote.overruns if self._remote else 0)
+
+    @property
+    def input_overflows(self) -> int:
+        """Overflows reported by PortAudio itself."""
+        return self._ring.input_overflows if self._ring else 0
+
+    @property
+    def fill_level(self) -> float:
+        """Fraction of the capture ring waiting to be decoded."""
+        return self._ring.fill_level if self._ring else 0.0
+
     @Property(str, notify=state_changed) # type: ignore[call-arg]
     def state(self) -> str: # type: ignore
         return self._state
@@ -41,95 +102,339 @@ class SpeechWorker(QObject):
     @Slot()
     def pause(self):
         logging.info("SpeechWorker.pause()")
-        self._paused = True
+        with self._wakeup:
+            self._paused = True
 
     @Slot()
     def resume(self):
         logging.info("SpeechWorker.resume()")
-        self._paused = False
+        with self._wakeup:
+            self._paused = False
+            self._wakeup.notify_all()
+
+    def _suspend(self, stream) -> bool:
+        """Stop capture and sleep until resume() or stop_listening().
+
+        Returns False if the worker should exit instead of resuming.
+        """
+        stream.stop_stream()
+        self.state = "idle" # type: ignore
+        logging.info('SpeechWorker: suspended')
+        with self._wakeup:
+            while self._paused and not self._stop_requested:
+                if self._dump_path:
+                    path, self._dump_path = self._dump_path, None
+                    self._write_flight_recording(path)
+                else:
+                    self._wakeup.wait()
+        if self._stop_requested:
+            return False
+        if self._ring:
+            self._ring.clear()
+        stream.start_stream()
+        logging.info('SpeechWorker: resumed')
+        return True
+
+    @Slot(str)
+    def swap_model(self, model_path: str):
+        """Switch to another model at the next utterance boundary, keeping the stream open."""
+        logging.info(f"SpeechWorker.swap_model({model_path})")
+        self._pending_model = model_path
+
+    @Slot(bool)
+    def set_command_mode(self, enabled: bool):
+        """Decode only `commands` from the next utterance boundary on, with the same model.
+
+        A grammar-restricted search is much cheaper than dictation; results
+        come out through `command` instead of `recognized`.
+        """
+        logging.info(f"SpeechWorker.set_command_mode({enabled})")
+        self.command_mode = enabled
+        self._mode_changed = True
+
+    def _command_grammar(self) -> Optional[str]:
+        if not (self.command_mode and self.commands):
+            return None
+        # "[unk]" soaks up everything else instead of forcing the closest command
+        return json.dumps(self.commands + ["[unk]"], ensure_ascii=False)
+
+    def _swap_recognizer(self, rec, rate: int):
+        model_path = self._pending_model or self.model_path
+        self._pending_model, self._mode_changed = None, False
+        if isinstance(rec, MultiLanguageRecognizer):
+            # Restarting every decoder process mid-stream would stall capture for seconds
+            if model_path != self.model_path:
+                logging.warning(f'SpeechWorker: {model_path} will be used from the next start_listening(), '
+                                f'the multi-language decoders keep their models while running')
+            if self.command_mode:
+                logging.warning('SpeechWorker: command mode is not available with multi-language recognition')
+            return rec
+        if isinstance(rec, RemoteRecognizer):
+            if self.command_mode:
+                logging.warning('SpeechWorker: command mode is not available with the decoder process')
+            if model_path != self.model_path:
+                model_pins.pin(model_path)
+                self._pinned.append(model_path)
+                rec.swap_model(model_path)
+                self.model_path = model_path
+            return rec
+        grammar = self._command_grammar()
+        if model_path == self.model_path and grammar == self._grammar:
+            return rec
+        new_rec = model_pool.acquire_recognizer(model_path, rate, grammar)
+        model_pool.release_recognizer(rec)
+        logging.info(f'SpeechWorker: switched to {model_path} ({"commands" if grammar else "dictation"})')
+        self.model_path, self._grammar = model_path, grammar
+        return new_rec
+
+    def _emit_partial(self, rec):
+        """Rate-limited partial hypothesis, skipped when nobody listens."""
+        now = time.monotonic()
+        if now - self._last_partial_time < self.partial_interval:
+            return
+        self._last_partial_time = now
+        if not self.receivers(SIGNAL("partial_result(QString)")):
+            return
+        partial = json.loads(rec.PartialResult()).get("partial", "")
+        if partial and partial != self._last_partial:
+            self._last_partial = partial
+            self._events.append((time.monotonic(), "partial", partial))
+            self.partial_result.emit(partial)
+            self.state = "processing" # type: ignore
+
+    def _dispatch_remote(self, results):
+        """Turn results coming back from the decoder process into the usual signals."""
+        for kind, text in results:
+            if kind == "final":
+                self._last_partial = ""
+                if text:
+                    self._emit_recognized(text)
+                self.state = "listening" # type: ignore
+            elif kind == "partial" and text != self._last_partial:
+                self._last_partial = text
+                self._events.append((time.monotonic(), "partial", text))
+                self.partial_result.emit(text)
+                self.state = "processing" # type: ignore
+            elif kind == "error":
+                self.error.emit(text)
+
+    def _emit_recognized(self, text: str):
+        now = time.monotonic()
+        latency_stats.record("endpoint", now - self._captured_at)
+        self.emitted_at.append((now, self._captured_at))
+        self._events.append((now, "final", text))
+        tracer.instant("recognized")
+        self.recognized.emit(text)
+
+    @Slot(str, result=bool)
+    def request_flight_dump(self, path: str) -> bool:
+        """Save the last FLIGHT_RECORDER_SECONDS of raw audio plus recognizer events to `path` (.npz).
+
+        Safe to call from any thread: the file is written by the worker loop,
+        between two blocks or while suspended. Returns False if the loop is
+        not running, in which case nothing is written.
+        """
+        with self._wakeup:
+            if not self.main_loop_active:
+                return False
+            self._dump_path = path
+            self._wakeup.notify_all()
+        return True
+
+    def _take_dump_path(self) -> Optional[str]:
+        with self._wakeup:
+            path, self._dump_path = self._dump_path, None
+        return path
+
+    def _write_flight_recording(self, path: str):
+        try:
+            if not self._recorder:
+                raise RuntimeError("nothing recorded yet")
+            audio = self._recorder.latest()
+            end = self._captured_at
+            start = end - len(audio) / self._recorder_rate
+            events = [{"time": t - start, "kind": kind, "text": text}
+                      for t, kind, text in list(self._events) if t >= start]
+            np.savez_compressed(
+                path, audio=audio, sample_rate=self._recorder_rate,
+                start_monotonic=start, wall_clock_at_end=time.time() - (time.monotonic() - end),
+                events=json.dumps(events, ensure_ascii=False))
+            logging.info(f'SpeechWorker: flight recording saved to {path}')
+            self.flight_recording_saved.emit(path)
+        except Exception as e:
+            self.error.emit(f"Flight recording failed: {e}")
+
+    def _emit_command(self, text: str):
+        now = time.monotonic()
+        latency_stats.record("command", now - self._captured_at)
+        self._events.append((now, "command", text))
+        self.command.emit(text)
+
+    def _emit_result(self, result_json: str):
+        self._utterance_open = False
+        self._last_partial = ""
+        text = json.loads(result_json).get("text", "").strip()
+        if self._grammar:
+            text = " ".join(word for word in text.split() if word != "[unk]")
+            if text:
+                self._emit_command(text)
+        elif text:
+            self._emit_recognized(text)
+        self.state = "listening" # type: ignore
 
     @Slot()
     def start_listening(self):
         """Start the speech recognition loop"""
         if self.main_loop_active:
             logging.error('SpeechWorker.start_listening(): already active, ignored')
-        self.main_loop_active = True
+        with self._wakeup:
+            self.main_loop_active = True
         logging.info('SpeechWorker.start_listening():')
         output_rate = 16000
         self.state = "uninitialized" # type: ignore
+        stream = None
+        rec = None
         try:
             if self.device_index is None:
                 raise ValueError("device_index is not set")
-            # Initialization
-            stream = None
-            model_path = model_cache.ensure_model()
-            model = Model(model_path)
-            time.sleep(0.25)
-            rec = KaldiRecognizer(model, output_rate)
-            time.sleep(0.25)
+            # Initialization: the model is shared process-wide, the recognizer is pooled
+            if len(self.languages) > 1:
+                # One decoder process per language; the VAD decides where utterances end.
+                # The configured model is only used if its language is one of them.
+                # Pinned as they come, so fetching one cannot evict another
+                from aikeyboard.config import app_config
+                entries = model_cache.get_models_for_languages(self.languages,
+                                                               self.model_name or str(app_config.model))
+                paths = []
+                for entry in entries:
+                    paths.append(model_cache.ensure_model(entry.name, pin=True))
+                    self._pinned.append(paths[-1])
+                self.model_path = paths[0]
+                rec = MultiLanguageRecognizer(paths, output_rate)
+            else:
+                self.model_path = model_cache.ensure_model(self.model_name, pin=True)
+                self._pinned.append(self.model_path)
+                if self.out_of_process:
+                    wants_partials = self.receivers(SIGNAL("partial_result(QString)")) > 0
+                    rec = RemoteRecognizer(self.model_path, output_rate,
+                                           self.partial_interval if wants_partials else None)
+                else:
+                    self._grammar = self._command_grammar()
+                    rec = model_pool.acquire_recognizer(self.model_path, output_rate, self._grammar)
+            self._mode_changed = False
+            remote = isinstance(rec, RemoteRecognizer)
+            self._remote = rec if remote else None
             logging.info('SpeechWorker.start_listening(): Vosk is initialized')
-            pa = device_manager.get_pa()
-
-            # Query actual rate of the selected input device
-            device_info = pa.get_device_info_by_index(self.device_index)
+            # Query actual rate of the selected input device; capturing at 16 kHz saves resampling
+            device_info = device_manager.get_device_info(self.device_index)
             input_rate = int(device_info['defaultSampleRate'])
+            if input_rate != output_rate and output_rate in device_manager.native_rates(self.device_index):
+                input_rate = output_rate
             logging.info(f"SpeechWorker.start_listening(): input rate for device {self.device_index}-{device_info['name']}: {input_rate} Hz")
             if device_info.get("maxInputChannels", 0) == 0:
                 raise RuntimeError(f"Device {self.device_index} does not support input!")
         
-            stream = device_manager.get_stream(input_rate, self.device_index, frames_per_buffer=8192)
+            blocks = BlockSizeController.from_seconds(input_rate, self.min_block, self.max_block)
+            resampler = StreamResampler(input_rate, output_rate, blocks.max_frames) if input_rate != output_rate else None
+            vad = VoiceActivityGate(output_rate) if self.use_vad or len(self.languages) > 1 else None
+
+            # Capture runs on the backend's thread, decoding consumes the ring here
+            self._ring = ring = AudioRingBuffer(int(input_rate * self.RING_SECONDS))
+            block = np.empty(blocks.max_frames, dtype=np.int16)
+            self._recorder = recorder = AudioRingBuffer(int(input_rate * self.FLIGHT_RECORDER_SECONDS))
+            self._recorder_rate = input_rate
+            stream = device_manager.open_stream(input_rate, self.device_index,
+                                                frames_per_buffer=self.CALLBACK_FRAMES, ring=ring)
 
             # Main loop
             logging.info('SpeechWorker.start_listening(): entering main loop')
+            tracer.name_thread("SpeechWorker")
             self.state = "listening" # type: ignore
+            decoded, decode_start = 0, 0.0
             while not self._stop_requested:
-                try:
-                    data = stream.read(4096, exception_on_overflow=False)
-                except Exception as e:
-                    logging.warning(f"Audio read error: {e}")
-                    continue
-
                 if self._paused:
-                    self.state = "idle" # type: ignore
-                    continue
-                if self.state == "idle":
+                    if remote:
+                        # Results of speech before the pause, not after the resume
+                        self._dispatch_remote(rec.flush())
+                    # Model and recognizer stay loaded, only capture stops
+                    if not self._suspend(stream):
+                        break
+                    rec.Reset()
+                    self._utterance_open = False
+                    if resampler:
+                        resampler.reset()
+                    if vad:
+                        vad.reset()
                     self.state = "listening" # type: ignore
 
-                # Downsample to 16000 if needed
-                if input_rate != output_rate:
-                    try:
-                        # data = audioop.ratecv(data, 2, 1, input_rate, 16000, None)[0]
-
-                        # Convert bytes to numpy array (16-bit mono audio)
-                        audio = np.frombuffer(data, dtype=np.int16)
+                if (self._pending_model or self._mode_changed) and not self._utterance_open:
+                    rec = self._swap_recognizer(rec, output_rate)
+                if remote:
+                    self._dispatch_remote(rec.poll())
+                dump_path = self._take_dump_path()
+                if dump_path:
+                    self._write_flight_recording(dump_path)
 
-                        # Calculate GCD for rational resample
-                        gcd = np.gcd(input_rate, output_rate)
-                        up = output_rate // gcd
-                        down = input_rate // gcd
-
-                        # Perform polyphase resampling
-                        resampled = resample_poly(audio, up, down)
-
-                        # Convert back to bytes
-                        data = resampled.astype(np.int16).tobytes()
+                # Size the next block on how long the previous one took to process
+                if decoded:
+                    now = time.perf_counter()
+                    blocks.update(decoded, now - decode_start, ring.available())
+                    tracer.complete("process_block", decode_start, now)
+                    decoded = 0
+                t0 = time.perf_counter()
+                if not ring.wait(blocks.frames, timeout=0.2 + blocks.frames / input_rate) and not ring.available():
+                    continue
+                captured = ring.get(blocks.frames, out=block)
+                decoded, decode_start = len(captured), time.perf_counter()
+                tracer.complete("wait_audio", t0, decode_start)
+                tracer.counter("capture_fill", ring.fill_level)
+                self._captured_at = ring.last_put_time - ring.available() / input_rate
+                recorder.append(captured)
+                if ring.overruns != self._last_overruns:
+                    logging.warning(f"SpeechWorker: decoder fell behind, {ring.dropped} samples dropped so far")
+                    self._last_overruns = ring.overruns
 
+                # Downsample to 16000 if needed
+                if resampler:
+                    try:
+                        t0 = time.perf_counter()
+                        pcm = resampler.process(captured)
+                        t1 = time.perf_counter()
+                        latency_stats.record("resample", t1 - t0)
+                        tracer.complete("resample", t0, t1)
                     except Exception as e:
                         logging.warning(f"Resample error: {e}")
-                        continue                
-
-                if rec.AcceptWaveform(data):
-                    result = json.loads(rec.Result())
-                    text = result.get("text", "").strip()
-                    if text:
-                        self.recognized.emit(text)
-                    self.state = "listening" # type: ignore
+                        continue
                 else:
-                    # Handle partial results and pause detection
-                    partial = json.loads(rec.PartialResult())
-                    if partial.get("partial", ""):
-                        self.partial_result.emit(partial['partial'])
-                        self.state= "processing" # type: ignore
+                    pcm = captured
+
+                # Only speech (plus pre-roll and hangover) reaches the recognizer
+                data = pcm.tobytes()
+                if vad:
+                    event = vad.feed(pcm)
+                    if event == vad.SILENCE:
+                        continue
+                    if event == vad.ENDPOINT:
+                        self._events.append((self._captured_at, "endpoint", ""))
+                        with tracer.span("final_result"):
+                            self._emit_result(rec.FinalResult())
+                        continue
+                    if event == vad.ONSET:
+                        self._events.append((self._captured_at, "onset", ""))
+                        data = vad.pre_roll().tobytes() + data
+
+                self._utterance_open = True
+                t0 = time.perf_counter()
+                final = rec.AcceptWaveform(data)
+                t1 = time.perf_counter()
+                latency_stats.record("accept_waveform", t1 - t0)
+                tracer.complete("accept_waveform", t0, t1)
+                if final:
+                    with tracer.span("result"):
+                        self._emit_result(rec.Result())
+                elif not remote and not self._grammar:
+                    with tracer.span("partial_result"):
+                        self._emit_partial(rec)
             logging.info('SpeechWorker.start_listening(): out of main loop')                
         except Exception as e:
             self.error.emit(str(e))
@@ -139,22 +444,71 @@ class SpeechWorker(QObject):
             if stream:
                 stream.stop_stream()
                 stream.close()
-            self.main_loop_active = False
+            if isinstance(rec, RemoteRecognizer):
+                self._dispatch_remote(rec.flush())     # the last utterance may still be decoding
+            if isinstance(rec, (MultiLanguageRecognizer, RemoteRecognizer)):
+                rec.close()
+            elif rec:
+                model_pool.release_recognizer(rec)
+            for path in self._pinned:
+                model_pins.unpin(path)
+            self._pinned = []
+            with self._wakeup:
+                self.main_loop_active = False
+            dump_path = self._take_dump_path()
+            if dump_path:
+                self._write_flight_recording(dump_path)
             self.finished.emit()
 
     @Slot()
     def stop_listening(self):
         """Request the thread to stop"""
         logging.info('SpeechWorker.stop_listening():')
-        self._stop_requested = True
+        with self._wakeup:
+            self._stop_requested = True
+            self._wakeup.notify_all()
+
+
+class ModelPreloader(QObject):
+    """Downloads, loads and warms up a model (default: the configured one) off the GUI thread."""
+    loaded = Signal(str)         # model path
+    error = Signal(str)
+    finished = Signal()
+
+    def __init__(self, model_name: Optional[str] = None):
+        super().__init__()
+        self.model_name = model_name
+
+    @Slot()
+    def run(self):
+        try:
+            model_path = model_cache.ensure_model(self.model_name, pin=True)
+            try:
+                model_pool.preload(model_path)      # the pool keeps it pinned while loaded
+            finally:
+                model_pins.unpin(model_path)
+            logging.info(f'ModelPreloader: {model_path} is ready')
+            self.loaded.emit(model_path)
+        except Exception as e:
+            self.error.emit(str(e))
+        finally:
+            self.finished.emit()
 
 
 class SpeechRecognizer(QObject):
     worker_created = Signal(object)
 
-    def __init__(self, device_index=None):
+    def __init__(self, device_index=None, partial_interval=0.25, languages=None, out_of_process=False,
+                 min_block=0.064, max_block=0.512, commands=None):
         super().__init__()
         self.device_index = device_index
+        self.partial_interval = partial_interval
+        self.languages = languages
+        self.out_of_process = out_of_process
+        self.min_block = min_block
+        self.max_block = max_block
+        self.commands = commands
+        self.command_mode = False
         self.worker: Optional[SpeechWorker] = None
         self.thread: Optional[QThread] = None
 
@@ -162,7 +516,12 @@ class SpeechRecognizer(QObject):
         """Start thread only once"""
         if not self.thread:
             logging.info('SpeechRecognizer.start():')
-            self.worker = SpeechWorker(self.device_index)
+            self.worker = SpeechWorker(self.device_index, partial_interval=self.partial_interval,
+                                       languages=self.languages, out_of_process=self.out_of_process,
+                                       min_block=self.min_block, max_block=self.max_block,
+                                       commands=self.commands)
+            if self.command_mode:
+                self.worker.set_command_mode(True)
             self.thread = QThread()
             self.worker.moveToThread(self.thread)
 
@@ -176,6 +535,10 @@ class SpeechRecognizer(QObject):
             self.thread.started.connect(self.worker.start_listening)
             self.worker_created.emit(self.worker)
 
+    def swap_model(self, model_path: str):
+        if self.worker:
+            self.worker.swap_model(model_path)
+
     def listen(self):
         self.start()
         if self.worker:
@@ -185,9 +548,14 @@ class SpeechRecognizer(QObject):
         if self.worker:
             self.worker.pause()
 
+    def set_command_mode(self, enabled: bool):
+        self.command_mode = enabled
+        if self.worker:
+            self.worker.set_command_mode(enabled)
+
     def stop(self):
         if self.worker:
-            self.worker._stop_requested = True
+            self.worker.stop_listening()
         if self.thread:
             self.thread.quit()
             self.thread.wait()
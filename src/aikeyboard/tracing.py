@@ -0,0 +1,137 @@
+# src/aikeyboard/tracing.py
+import json
+import os
+import threading
+import time
+from contextlib import nullcontext
+from itertools import count
+from typing import Dict, List
+
+import numpy as np
+
+_COMPLETE, _INSTANT, _COUNTER = 0, 1, 2
+_PHASES = ("X", "i", "C")
+_DISABLED = nullcontext()
+
+
+class _Span:
+    __slots__ = ("tracer", "name", "start")
+
+    def __init__(self, tracer: '_Tracer', name: str):
+        self.tracer = tracer
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *_exc):
+        self.tracer.complete(self.name, self.start, time.perf_counter())
+        return False
+
+
+class _Tracer:
+    """Opt-in timeline of what every thread was doing, exported as Chrome trace JSON.
+
+    Events go into preallocated arrays used as a ring, so only the most
+    recent `capacity` are kept and recording never allocates storage.
+    Enabled by AIKEYBOARD_TRACE=1 or set_enabled(); while disabled span()
+    returns a shared no-op context manager. Open the exported file in
+    chrome://tracing or ui.perfetto.dev.
+    """
+
+    def __init__(self, capacity: int = 65536):
+        self.capacity = capacity
+        self.enabled = os.environ.get("AIKEYBOARD_TRACE", "") not in ("", "0")
+        self._lock = threading.Lock()
+        self._names: Dict[str, int] = {}
+        self._name_list: List[str] = []
+        self._threads: Dict[int, str] = {}
+        self._start = np.zeros(capacity, dtype=np.float64)
+        self._value = np.zeros(capacity, dtype=np.float64)    # duration, or counter value
+        self._tid = np.zeros(capacity, dtype=np.int64)
+        self._name = np.zeros(capacity, dtype=np.int32)
+        self._phase = np.zeros(capacity, dtype=np.uint8)
+        self._counter = count()
+        self._recorded = 0
+
+    def set_enabled(self, enabled: bool):
+        self.enabled = enabled
+
+    def clear(self):
+        with self._lock:
+            self._counter = count()
+            self._recorded = 0
+
+    def _intern(self, name: str) -> int:
+        index = self._names.get(name)
+        if index is None:
+            with self._lock:
+                index = self._names.setdefault(name, len(self._name_list))
+                if index == len(self._name_list):
+                    self._name_list.append(name)
+        return index
+
+    def _record(self, phase: int, name: str, start: float, value: float):
+        tid = threading.get_ident()
+        if tid not in self._threads:
+            self._threads[tid] = threading.current_thread().name
+        i = next(self._counter)     # atomic under the GIL
+        self._recorded = i + 1
+        slot = i % self.capacity
+        self._start[slot] = start
+        self._value[slot] = value
+        self._tid[slot] = tid
+        self._name[slot] = self._intern(name)
+        self._phase[slot] = phase
+
+    def name_thread(self, name: str):
+        """Label the calling thread; threads not started from Python are "Dummy-N" otherwise."""
+        if self.enabled:
+            self._threads[threading.get_ident()] = name
+
+    def span(self, name: str):
+        """Context manager recording a begin/end pair on the calling thread."""
+        return _Span(self, name) if self.enabled else _DISABLED
+
+    def complete(self, name: str, start: float, end: float):
+        """Record a span measured elsewhere (perf_counter() values)."""
+        if self.enabled:
+            self._record(_COMPLETE, name, start, end - start)
+
+    def instant(self, name: str):
+        if self.enabled:
+            self._record(_INSTANT, name, time.perf_counter(), 0.0)
+
+    def counter(self, name: str, value: float):
+        if self.enabled:
+            self._record(_COUNTER, name, time.perf_counter(), value)
+
+    def to_dict(self) -> dict:
+        pid = os.getpid()
+        n = min(self._recorded, self.capacity)
+        first = self._recorded - n
+        events = [{"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": thread}}
+                  for tid, thread in self._threads.items()]
+        for i in range(first, first + n):
+            slot = i % self.capacity
+            phase = int(self._phase[slot])
+            name = self._name_list[self._name[slot]]
+            event = {"name": name, "ph": _PHASES[phase], "ts": self._start[slot] * 1e6,
+                     "pid": pid, "tid": int(self._tid[slot])}
+            if phase == _COMPLETE:
+                event["dur"] = self._value[slot] * 1e6
+            elif phase == _INSTANT:
+                event["s"] = "t"
+            else:
+                event["args"] = {name: float(self._value[slot])}
+            events.append(event)
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def export(self, path) -> str:
+        with open(path, 'w') as fo:
+            json.dump(self.to_dict(), fo)
+        return str(path)
+
+
+tracer = _Tracer()
@@ -0,0 +1,194 @@
+# src/aikeyboard/vad.py
+import numpy as np
+
+from aikeyboard.ring_buffer import AudioRingBuffer
+
+
+def block_dbfs(samples: np.ndarray, scratch: np.ndarray) -> float:
+    """RMS level of an int16 block in dBFS, using `scratch` as float32 work area."""
+    n = len(samples)
+    if n == 0:
+        return -100.0
+    x = scratch[:n]
+    np.multiply(samples, 1.0 / 32768.0, out=x, casting='unsafe')
+    return 10.0 * np.log10(float(np.dot(x, x)) / n + 1e-10)
+
+
+class P2Quantile:
+    """Streaming estimate of the q-quantile in constant memory (Jain & Chlamtac P² algorithm).
+
+    Five markers are kept and nudged towards their ideal positions with a
+    piecewise-parabolic fit; nothing is allocated per value.
+    """
+
+    def __init__(self, q: float = 0.5):
+        self.q = q
+        self.count = 0
+        self._heights = [0.0] * 5
+        self._positions = [1.0, 2.0, 3.0, 4.0, 5.0]
+        self._desired = [1.0, 1.0 + 2 * q, 1.0 + 4 * q, 3.0 + 2 * q, 5.0]
+        self._increments = (0.0, q / 2, q, (1.0 + q) / 2, 1.0)
+
+    @property
+    def value(self) -> float:
+        if self.count >= 5:
+            return self._heights[2]
+        if self.count == 0:
+            return 0.0
+        first = sorted(self._heights[:self.count])
+        return first[min(int(self.q * self.count), self.count - 1)]
+
+    def add(self, x: float):
+        h, n = self._heights, self._positions
+        if self.count < 5:
+            h[self.count] = x
+            self.count += 1
+            if self.count == 5:
+                h.sort()
+            return
+        self.count += 1
+
+        if x < h[0]:
+            h[0] = x
+            k = 0
+        elif x >= h[4]:
+            h[4] = x
+            k = 3
+        else:
+            k = 0
+            while x >= h[k + 1]:
+                k += 1
+        for i in range(k + 1, 5):
+            n[i] += 1.0
+        for i in range(5):
+            self._desired[i] += self._increments[i]
+
+        for i in (1, 2, 3):
+            d = self._desired[i] - n[i]
+            if (d >= 1.0 and n[i + 1] - n[i] > 1.0) or (d <= -1.0 and n[i - 1] - n[i] < -1.0):
+                step = 1.0 if d > 0 else -1.0
+                # Parabolic prediction, linear if it would break the ordering
+                parabolic = h[i] + step / (n[i + 1] - n[i - 1]) * (
+                    (n[i] - n[i - 1] + step) * (h[i + 1] - h[i]) / (n[i + 1] - n[i])
+                    + (n[i + 1] - n[i] - step) * (h[i] - h[i - 1]) / (n[i] - n[i - 1]))
+                if h[i - 1] < parabolic < h[i + 1]:
+                    h[i] = parabolic
+                else:
+                    j = i + int(step)
+                    h[i] += step * (h[j] - h[i]) / (n[j] - n[i])
+                n[i] += step
+
+
+class VoiceActivityGate:
+    """Energy gate deciding which blocks are worth sending to the recognizer.
+
+    Like SilenceDetector it compares block energy with a calibrated noise
+    floor, but the floor keeps adapting during silence, speech is held open
+    for a short hangover, and the audio preceding an onset is kept in a
+    pre-roll buffer so the first syllable reaches the recognizer. A pause
+    longer than the hangover but shorter than flush_after is held back
+    too, and replayed as pre-roll if speech resumes within the utterance.
+    """
+    SILENCE = 0     # drop the block
+    ONSET = 1       # feed pre_roll() followed by the block
+    SPEECH = 2      # feed the block
+    ENDPOINT = 3    # long silence: flush the recognizer, drop the block
+
+    def __init__(self, sample_rate=16000, pre_roll=0.3, hangover=0.4, flush_after=1.0,
+                 margin_db=6.0, calibration_duration=0.5, max_speech=15.0, min_db=-60.0):
+        self.sample_rate = sample_rate
+        self.hangover = hangover
+        self.flush_after = flush_after
+        self.margin_db = margin_db
+        self.calibration_duration = calibration_duration
+        self.max_speech = max_speech
+        self.min_db = min_db
+        self.noise_floor_db = -50.0
+        self.calibrated = False
+        self._calibration = P2Quantile(0.5)
+        self._calibration_time = 0.0
+        self._pre_roll_samples = int(pre_roll * sample_rate)
+        # Large enough to hold a whole pause between hangover and flush_after
+        self._pre_roll = AudioRingBuffer(max(self._pre_roll_samples,
+                                             int((flush_after - hangover) * sample_rate)))
+        self._onset_buf = np.empty(self._pre_roll.capacity, dtype=np.int16)
+        self._onset = self._onset_buf[:0]
+        self._scratch = np.empty(sample_rate, dtype=np.float32)
+        self._active = False        # recognizer has pending audio
+        self._speech_time = 0.0
+        self._silent_time = 0.0
+        self._speech_min_db = 0.0
+
+    @property
+    def threshold_db(self) -> float:
+        return max(self.noise_floor_db + self.margin_db, self.min_db)
+
+    def reset(self):
+        """Drop pending state (noise floor is kept)."""
+        self._pre_roll.clear()
+        self._active = False
+        self._speech_time = 0.0
+        self._silent_time = 0.0
+
+    def pre_roll(self) -> np.ndarray:
+        """Audio captured just before the last ONSET: pre-roll, or the pause speech resumed after."""
+        return self._onset
+
+    def _level(self, samples: np.ndarray) -> float:
+        if len(samples) > len(self._scratch):
+            self._scratch = np.empty(len(samples), dtype=np.float32)
+        return block_dbfs(samples, self._scratch)
+
+    def feed(self, samples: np.ndarray) -> int:
+        """Classify one block of 16-bit samples, returning one of the event constants."""
+        duration = len(samples) / self.sample_rate
+        level = self._level(samples)
+
+        if not self.calibrated:
+            self._calibration.add(level)
+            self._calibration_time += duration
+            if self._calibration_time >= self.calibration_duration:
+                self.noise_floor_db = self._calibration.value
+                self.calibrated = True
+            self._pre_roll.append(samples)
+            return self.SILENCE
+
+        if level >= self.threshold_db:
+            paused = self._active and self._silent_time > self.hangover
+            self._silent_time = 0.0
+            if not self._active:
+                self._active = True
+                self._speech_time = duration
+                self._speech_min_db = level
+                self._onset = self._pre_roll.latest(self._pre_roll_samples, out=self._onset_buf)
+                self._pre_roll.clear()
+                return self.ONSET
+            self._speech_time += duration
+            self._speech_min_db = min(self._speech_min_db, level)
+            if self._speech_time > self.max_speech:
+                # Sustained "speech" is more likely a louder background: re-learn the floor
+                self.noise_floor_db = self._speech_min_db
+                self._active = False
+                self._pre_roll.clear()
+                return self.ENDPOINT
+            if paused:
+                # Speech resumed within the utterance: replay the held-back pause
+                self._onset = self._pre_roll.latest(out=self._onset_buf)
+                self._pre_roll.clear()
+                return self.ONSET
+            return self.SPEECH
+
+        # Quiet block: follow the noise floor, quickly downwards and slowly upwards
+        rate = 0.5 if level < self.noise_floor_db else 0.05
+        self.noise_floor_db += rate * (level - self.noise_floor_db)
+
+        if self._active:
+            self._silent_time += duration
+            if self._silent_time <= self.hangover:
+                return self.SPEECH
+            if self._silent_time >= self.flush_after:
+                self._active = False
+                self._pre_roll.append(samples)
+                return self.ENDPOINT
+        self._pre_roll.append(samples)
+        return self.SILENCE
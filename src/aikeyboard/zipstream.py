@@ -0,0 +1,238 @@
+# src/aikeyboard/zipstream.py
+"""Extract a zip archive front to back while it is still arriving.
+
+zipfile needs the central directory at the end of the archive; this reads
+the local file headers in order instead, so each member can be written as
+soon as its bytes are in. Stored and deflated members are supported,
+including ZIP64 sizes and, for deflated members, sizes given in a trailing
+data descriptor. Other members raise NotStreamable: extract_indexed()
+takes over from there once the central directory has arrived.
+"""
+import io
+import struct
+import zipfile
+import zlib
+from pathlib import Path, PurePosixPath
+from typing import Callable, Optional
+from zipfile import BadZipFile
+
+LOCAL_HEADER = struct.Struct("<4sHHHHHIIIHH")   # signature ... file name length, extra length
+LOCAL_SIGNATURE = b"PK\x03\x04"
+DESCRIPTOR_SIGNATURE = b"PK\x07\x08"
+END_SIGNATURES = (b"PK\x01\x02", b"PK\x05\x06", b"PK\x06\x06")    # central directory onwards
+ZIP64_EXTRA = 0x0001
+COPY_CHUNK = 1024 * 1024
+
+ReadAt = Callable[[int, int], bytes]    # (offset, size) -> bytes, blocking, short only at end of file
+
+
+class NotStreamable(BadZipFile):
+    """A member whose end cannot be found from its local header.
+
+    Stored members with a data descriptor, or compression methods other than
+    deflate. `offset` is the start of its local header.
+    """
+
+    def __init__(self, name: str, offset: int):
+        super().__init__(f"{name} cannot be extracted before the central directory is in")
+        self.offset = offset
+
+
+class _Reader:
+    """Sequential reads over a ReadAt, with push-back of over-read bytes."""
+
+    def __init__(self, read_at: ReadAt, offset: int):
+        self._read_at = read_at
+        self.offset = offset        # position of the next byte handed out
+        self._pending = b""
+
+    def read(self, size: int) -> bytes:
+        if self._pending:
+            data, self._pending = self._pending[:size], self._pending[size:]
+        else:
+            data = self._read_at(self.offset, size)
+        self.offset += len(data)
+        return data
+
+    def read_exact(self, size: int) -> bytes:
+        data = self.read(size)
+        while len(data) < size:
+            more = self.read(size - len(data))
+            if not more:
+                raise BadZipFile(f"Archive truncated at byte {self.offset}")
+            data += more
+        return data
+
+    def unread(self, data: bytes):
+        self._pending = data + self._pending
+        self.offset -= len(data)
+
+
+def _zip64_sizes(extra: bytes, size: int, compressed: int):
+    """Sizes with ZIP64 values filled in, and whether there is a ZIP64 field at all."""
+    position = 0
+    while position + 4 <= len(extra):
+        tag, length = struct.unpack_from("<HH", extra, position)
+        if tag == ZIP64_EXTRA:
+            values = extra[position + 4:position + 4 + length]
+            fields = []
+            for i in range(0, len(values) - 7, 8):
+                fields.append(struct.unpack_from("<Q", values, i)[0])
+            if size == 0xFFFFFFFF:
+                size = fields.pop(0)
+            if compressed == 0xFFFFFFFF:
+                compressed = fields.pop(0)
+            return size, compressed, True
+        position += 4 + length
+    return size, compressed, False
+
+
+def _target(dest: Path, name: str) -> Path:
+    path = PurePosixPath(name.replace("\\", "/"))
+    if path.is_absolute() or ".." in path.parts:
+        raise BadZipFile(f"Refusing to extract {name!r} outside the destination")
+    return dest.joinpath(*path.parts)
+
+
+def _copy(reader: _Reader, out, compressed: int) -> int:
+    crc = 0
+    while compressed:
+        data = reader.read(min(COPY_CHUNK, compressed))
+        if not data:
+            raise BadZipFile(f"Archive truncated at byte {reader.offset}")
+        out.write(data)
+        crc = zlib.crc32(data, crc)
+        compressed -= len(data)
+    return crc
+
+
+def _inflate(reader: _Reader, out, compressed: Optional[int]) -> int:
+    # With a data descriptor the compressed size is unknown: the deflate
+    # stream itself says where it ends, and what was read past it goes back
+    inflater = zlib.decompressobj(-zlib.MAX_WBITS)
+    crc = 0
+    left = compressed
+    while not inflater.eof:
+        want = COPY_CHUNK if left is None else min(COPY_CHUNK, left)
+        data = reader.read(want) if want else b""
+        if not data:
+            raise BadZipFile(f"Archive truncated at byte {reader.offset}")
+        if left is not None:
+            left -= len(data)
+        data = inflater.decompress(data)
+        out.write(data)
+        crc = zlib.crc32(data, crc)
+    if inflater.unused_data:
+        reader.unread(inflater.unused_data)
+        if left is not None:
+            left += len(inflater.unused_data)
+    if left:
+        reader.read_exact(left)     # padding after the deflate stream
+    return crc
+
+
+def extract(read_at: ReadAt, dest, offset: int = 0,
+            member_done: Optional[Callable[[int], None]] = None) -> int:
+    """Extract the archive read through `read_at` into `dest`, starting at `offset`.
+
+    `offset` must be the start of a local header: 0, or a value previously
+    passed to `member_done`, which is called with the offset of the next
+    header after each member is complete on disk. Returns the number of
+    members extracted.
+    """
+    dest = Path(dest)
+    dest.mkdir(parents=True, exist_ok=True)
+    reader = _Reader(read_at, offset)
+    members = 0
+    while True:
+        header_offset = reader.offset
+        signature = reader.read_exact(4)
+        if signature in END_SIGNATURES:
+            return members
+        if signature != LOCAL_SIGNATURE:
+            raise BadZipFile(f"Bad local header signature at byte {reader.offset - 4}")
+        (_, _, flags, method, _, _, crc, compressed, size,
+         name_length, extra_length) = LOCAL_HEADER.unpack(signature + reader.read_exact(LOCAL_HEADER.size - 4))
+        name = reader.read_exact(name_length).decode("utf-8" if flags & 0x800 else "cp437")
+        extra = reader.read_exact(extra_length)
+        if flags & 0x1:
+            raise BadZipFile(f"{name} is encrypted")
+        descriptor = bool(flags & 0x8)
+        size, compressed, zip64 = _zip64_sizes(extra, size, compressed)
+
+        target = _target(dest, name)
+        directory = name.endswith("/")
+        if not (method == 8 or (method == 0 and (directory or not descriptor))):
+            raise NotStreamable(name, header_offset)
+        if directory:
+            # Directory entries have no content, but may still carry an empty deflate stream
+            target.mkdir(parents=True, exist_ok=True)
+            sink = io.BytesIO()
+        else:
+            target.parent.mkdir(parents=True, exist_ok=True)
+            sink = open(target, "wb")
+        with sink as out:
+            if method == 0:
+                actual_crc = _copy(reader, out, 0 if descriptor else compressed)
+            else:
+                actual_crc = _inflate(reader, out, None if descriptor else compressed)
+
+        if descriptor:
+            signature = reader.read_exact(4)
+            if signature != DESCRIPTOR_SIGNATURE:
+                reader.unread(signature)        # the signature is optional
+            crc, = struct.unpack("<I", reader.read_exact(4))
+            reader.read_exact(16 if zip64 else 8)
+        if actual_crc != crc:
+            raise BadZipFile(f"CRC mismatch in {name}")
+        members += 1
+        if member_done:
+            member_done(reader.offset)
+
+
+class _RandomAccess(io.RawIOBase):
+    """Seekable file object over a ReadAt of known size, for zipfile."""
+
+    def __init__(self, read_at: ReadAt, size: int):
+        self._read_at = read_at
+        self._size = size
+        self._position = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._position
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self._position, io.SEEK_END: self._size}[whence]
+        self._position = max(0, base + offset)
+        return self._position
+
+    def readinto(self, buffer) -> int:
+        size = min(len(buffer), self._size - self._position)
+        if size <= 0:
+            return 0
+        data = self._read_at(self._position, size)
+        buffer[:len(data)] = data
+        self._position += len(data)
+        return len(data)
+
+
+def extract_indexed(read_at: ReadAt, size: int, dest, offset: int = 0) -> int:
+    """Extract with zipfile the members whose local header is at or after `offset`.
+
+    For archives extract() gave up on: the whole file must be readable from
+    `offset` on, including the central directory at its end, but nothing
+    before `offset` is read. Returns the number of members extracted.
+    """
+    members = 0
+    with zipfile.ZipFile(_RandomAccess(read_at, size)) as archive:
+        for info in archive.infolist():
+            if info.header_offset >= offset:
+                archive.extract(info, dest)
+                members += 1
+    return members
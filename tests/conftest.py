@@ -0,0 +1,5 @@
+# tests/conftest.py
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
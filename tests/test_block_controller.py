@@ -0,0 +1,59 @@
+# tests/test_block_controller.py
+from aikeyboard.block_controller import BlockSizeController
+
+RATE = 16000
+
+
+def _run(controller: BlockSizeController, load: float, backlog: int = 0, blocks: int = 50):
+    """Feed `blocks` blocks that each take `load` times their duration to decode; sizes seen."""
+    sizes = []
+    for _ in range(blocks):
+        frames = controller.frames
+        controller.update(frames, load * frames / RATE, backlog)
+        sizes.append(controller.frames)
+    return sizes
+
+
+def test_grows_under_load_up_to_the_maximum():
+    controller = BlockSizeController(RATE, min_frames=1024, max_frames=8192)
+    sizes = _run(controller, load=0.9)
+    assert sizes[-1] == 8192
+    assert all(1024 <= s <= 8192 for s in sizes)
+    assert all(b in (a, 2 * a) for a, b in zip([1024] + sizes, sizes))      # doubling steps only
+
+
+def test_shrinks_back_when_the_load_drops():
+    controller = BlockSizeController(RATE, min_frames=1024, max_frames=8192)
+    _run(controller, load=0.9)
+    sizes = _run(controller, load=0.05, blocks=100)
+    assert sizes[-1] == 1024
+    assert all(1024 <= s <= 8192 for s in sizes)
+    assert sizes == sorted(sizes, reverse=True)
+
+
+def test_backlog_grows_blocks_even_when_decoding_is_cheap():
+    controller = BlockSizeController(RATE, min_frames=1024, max_frames=8192)
+    sizes = _run(controller, load=0.05, backlog=10 * 8192, blocks=30)
+    assert sizes[-1] == 8192
+
+
+def test_cooldown_holds_the_size_between_changes():
+    controller = BlockSizeController(RATE, min_frames=1024, max_frames=8192, cooldown=4)
+    sizes = _run(controller, load=0.9, blocks=30)
+    changes = [i for i in range(1, len(sizes)) if sizes[i] != sizes[i - 1]]
+    assert len(changes) >= 2
+    assert all(b - a > 4 for a, b in zip(changes, changes[1:]))
+
+
+def test_moderate_load_keeps_the_size():
+    controller = BlockSizeController(RATE, min_frames=1024, max_frames=8192)
+    _run(controller, load=0.9, blocks=6)
+    frames = controller.frames
+    assert set(_run(controller, load=0.4, blocks=50)) == {frames}
+
+
+def test_from_seconds_and_degenerate_bounds():
+    controller = BlockSizeController.from_seconds(RATE, 0.064, 0.512)
+    assert (controller.min_frames, controller.max_frames, controller.frames) == (1024, 8192, 1024)
+    fixed = BlockSizeController(RATE, min_frames=2048, max_frames=512)
+    assert set(_run(fixed, load=0.9) + _run(fixed, load=0.0)) == {2048}
@@ -0,0 +1,172 @@
+# tests/test_downloader.py
+import json
+import os
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from aikeyboard import downloader
+from aikeyboard.downloader import RangedDownload, download
+
+PIECE = 64 * 1024
+
+
+class _Server:
+    """Local stand-in for the model host: ranges, ETag, injected failures."""
+
+    def __init__(self, data: bytes):
+        self.data = data
+        self.etag = '"v1"'
+        self.advertise_ranges = True
+        self.honour_ranges = True
+        self.reject_head = False
+        self.drops = 0              # range responses cut short after 1 KB
+        self.ranges = []            # (start, end) of every range request served
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *_args):
+                pass
+
+            def _headers(self, code, length, extra=()):
+                self.send_response(code)
+                self.send_header("Content-Length", str(length))
+                self.send_header("ETag", server.etag)
+                if server.advertise_ranges:
+                    self.send_header("Accept-Ranges", "bytes")
+                for key, value in extra:
+                    self.send_header(key, value)
+                self.end_headers()
+
+            def do_HEAD(self):
+                if server.reject_head:
+                    self._headers(405, 0)
+                    return
+                self._headers(200, len(server.data))
+
+            def do_GET(self):
+                match = re.match(r"bytes=(\d+)-(\d+)", self.headers.get("Range", ""))
+                if_range = self.headers.get("If-Range")
+                if match and server.honour_ranges and if_range in (None, server.etag):
+                    start, end = int(match[1]), int(match[2])
+                    server.ranges.append((start, end))
+                    body = server.data[start:end + 1]
+                    self._headers(206, len(body), [("Content-Range", f"bytes {start}-{end}/{len(server.data)}")])
+                    if server.drops > 0:
+                        server.drops -= 1
+                        self.wfile.write(body[:1024])
+                        self.wfile.flush()
+                        self.connection.shutdown(2)
+                        return
+                else:
+                    body = server.data
+                    self._headers(200, len(body))
+                self.wfile.write(body)
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_port}/model.zip"
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+@pytest.fixture
+def server():
+    srv = _Server(os.urandom(10 * PIECE + 123))
+    yield srv
+    srv.close()
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(downloader.time, "sleep", lambda _s: None)
+
+
+def test_parallel_ranges_survive_dropped_connections(server, tmp_path):
+    server.drops = 3
+    dest = download(server.url, tmp_path / "model.zip", connections=4, piece_size=PIECE)
+    assert dest.read_bytes() == server.data
+    assert not (tmp_path / "model.zip.parts").exists()
+
+
+def test_piece_failing_every_attempt_fails_the_download(server, tmp_path):
+    server.drops = 10 ** 6
+    with pytest.raises(IOError, match="kept failing"):
+        download(server.url, tmp_path / "model.zip", connections=2, piece_size=PIECE)
+    state = json.loads((tmp_path / "model.zip.parts" / "state.json").read_text())
+    assert all(done < PIECE for done in state["done"])
+
+
+def test_resume_fetches_only_what_is_missing(server, tmp_path):
+    parts = tmp_path / "model.zip.parts"
+    RangedDownload(server.url, parts, connections=2, piece_size=PIECE).start().join()
+
+    # Pretend the first run stopped with piece 3 half done and pieces 4+ not started
+    state = json.loads((parts / "state.json").read_text())
+    state["done"] = state["done"][:3] + [PIECE // 2] + [0] * (len(state["done"]) - 4)
+    (parts / "state.json").write_text(json.dumps(state))
+    with open(parts / "000003", "r+b") as f:
+        f.truncate(PIECE // 2 + 100)        # bytes written but never recorded are dropped
+    server.ranges.clear()
+
+    dl = RangedDownload(server.url, parts, connections=2, piece_size=PIECE).start()
+    dl.join()
+    assert dl.resumed
+    assert min(start for start, _ in server.ranges) == 3 * PIECE + PIECE // 2
+    assert dl.assemble(tmp_path / "model.zip").read_bytes() == server.data
+
+
+def test_changed_remote_file_starts_over(server, tmp_path):
+    parts = tmp_path / "model.zip.parts"
+    RangedDownload(server.url, parts, piece_size=PIECE).start().join()
+    server.etag = '"v2"'
+    server.ranges.clear()
+    dl = RangedDownload(server.url, parts, piece_size=PIECE).start()
+    dl.join()
+    assert not dl.resumed
+    assert min(start for start, _ in server.ranges) == 0
+
+
+@pytest.mark.parametrize("advertise", [False, True])
+def test_server_ignoring_ranges_gets_one_stream(server, tmp_path, advertise):
+    server.advertise_ranges = advertise
+    server.honour_ranges = False
+    dest = download(server.url, tmp_path / "model.zip", connections=4, piece_size=PIECE)
+    assert dest.read_bytes() == server.data
+    assert server.ranges == []
+
+
+def test_read_while_downloading(server, tmp_path):
+    dl = RangedDownload(server.url, tmp_path / "parts", connections=3, piece_size=PIECE).start()
+    chunks = []
+    offset = 0
+    while True:
+        data = dl.read(offset, 50_000)
+        if not data:
+            break
+        chunks.append(data)
+        offset += len(data)
+        dl.release(offset)
+    dl.join()
+    assert b"".join(chunks) == server.data
+    assert not any((tmp_path / "parts" / f"{i:06d}").exists() for i in range(9))
+
+
+@pytest.mark.parametrize("honour", [True, False])
+def test_server_rejecting_head_is_probed_with_a_range_request(server, tmp_path, honour):
+    server.reject_head = True
+    server.honour_ranges = honour
+    dest = download(server.url, tmp_path / "model.zip", connections=4, piece_size=PIECE)
+    assert dest.read_bytes() == server.data
+    if honour:
+        assert server.ranges[0] == (0, 0)
+        assert len(server.ranges) == 1 + 11     # the probe, then every piece
+    else:
+        assert server.ranges == []
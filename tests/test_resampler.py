@@ -0,0 +1,54 @@
+# tests/test_resampler.py
+import numpy as np
+import pytest
+
+from aikeyboard.resampler import StreamResampler
+
+signal = pytest.importorskip("scipy.signal")
+
+
+def _speechlike(rate: int, seconds: float = 1.0) -> np.ndarray:
+    rng = np.random.default_rng(rate)
+    t = np.arange(int(rate * seconds)) / rate
+    x = 8000 * np.sin(2 * np.pi * 440 * t) + 3000 * np.sin(2 * np.pi * 3100 * t) + 2000 * rng.standard_normal(len(t))
+    return x.astype(np.int16)
+
+
+def _random_splits(x: np.ndarray, rng, largest: int):
+    start = 0
+    while start < len(x):
+        size = int(rng.integers(1, largest))
+        yield x[start:start + size]
+        start += size
+
+
+@pytest.mark.parametrize("rate", [8000, 22050, 44100, 48000])
+def test_matches_resample_poly(rate):
+    x = _speechlike(rate)
+    resampler = StreamResampler(rate, 16000)
+    y = resampler.process(x).astype(np.float64)
+    reference = signal.resample_poly(x.astype(np.float64), resampler.up, resampler.down, window=("kaiser", 5.0))
+    # Streaming is causal: the output lags by half the filter length
+    delay = 10 * max(resampler.up, resampler.down) // resampler.down
+    n = len(y) - delay
+    assert n > 0.9 * len(reference)
+    assert np.max(np.abs(y[delay:] - reference[:n])) <= 1.0
+
+
+@pytest.mark.parametrize("rate", [22050, 44100, 48000])
+def test_block_splits_do_not_change_the_output(rate):
+    x = _speechlike(rate)
+    whole = StreamResampler(rate, 16000).process(x).copy()
+    rng = np.random.default_rng(0)
+    resampler = StreamResampler(rate, 16000, max_block=256)    # some blocks force a reallocation
+    pieces = [resampler.process(block).copy() for block in _random_splits(x, rng, 1500)]
+    np.testing.assert_array_equal(np.concatenate(pieces), whole)
+
+
+def test_bytes_input_and_reset():
+    x = _speechlike(48000, 0.1)
+    resampler = StreamResampler(48000, 16000)
+    first = resampler.process(x.tobytes()).copy()
+    assert len(first) == len(x) // 3
+    resampler.reset()
+    np.testing.assert_array_equal(resampler.process(x), first)
@@ -0,0 +1,63 @@
+# tests/test_ring_buffer.py
+import threading
+import time
+
+import numpy as np
+
+from aikeyboard.ring_buffer import AudioRingBuffer
+
+
+def test_fifo_wraps_around_in_order():
+    ring = AudioRingBuffer(10)
+    out = np.empty(10, dtype=np.int16)
+    expected = np.arange(1000, dtype=np.int16)
+    received = []
+    position = 0
+    for size in (7, 3, 9, 4, 8, 6, 10, 1):     # every block crosses or meets the end sooner or later
+        assert ring.put(expected[position:position + size]) == size
+        position += size
+        received.append(ring.get(size, out=out).copy())
+    np.testing.assert_array_equal(np.concatenate(received), expected[:position])
+    assert ring.written == position and ring.available() == 0
+    assert ring.overruns == 0
+
+
+def test_history_keeps_the_latest_samples():
+    ring = AudioRingBuffer(8)
+    ring.append(np.arange(5, dtype=np.int16))
+    np.testing.assert_array_equal(ring.latest(), np.arange(5))
+    ring.append(np.arange(5, 11, dtype=np.int16))      # wraps, overwriting 0..2
+    np.testing.assert_array_equal(ring.latest(), np.arange(3, 11))
+    np.testing.assert_array_equal(ring.latest(3), np.arange(8, 11))
+    ring.append(np.arange(100, 120, dtype=np.int16))   # more than the capacity at once
+    np.testing.assert_array_equal(ring.latest(), np.arange(112, 120))
+    assert len(ring) == 8
+
+
+def test_overruns_drop_what_does_not_fit():
+    ring = AudioRingBuffer(10)
+    assert ring.put(np.ones(6, dtype=np.int16)) == 6
+    assert ring.put(np.full(6, 2, dtype=np.int16)) == 4
+    assert ring.put(np.full(3, 3, dtype=np.int16)) == 0
+    assert (ring.overruns, ring.dropped) == (2, 5)
+    np.testing.assert_array_equal(ring.get(10), [1] * 6 + [2] * 4)
+    assert ring.fill_level == 0.0
+
+
+def test_wait_times_out_without_enough_data():
+    ring = AudioRingBuffer(100)
+    ring.put(np.zeros(10, dtype=np.int16))
+    start = time.monotonic()
+    assert not ring.wait(20, timeout=0.2)
+    assert 0.15 <= time.monotonic() - start < 2.0
+    assert ring.wait(10, timeout=0.0)
+
+
+def test_wait_wakes_up_when_the_producer_delivers():
+    ring = AudioRingBuffer(100)
+    producer = threading.Timer(0.1, lambda: ring.put(np.zeros(30, dtype=np.int16)))
+    producer.start()
+    start = time.monotonic()
+    assert ring.wait(30, timeout=5.0)
+    assert time.monotonic() - start < 2.0
+    producer.join()
@@ -0,0 +1,56 @@
+# tests/test_vad.py
+import numpy as np
+
+from aikeyboard.vad import VoiceActivityGate
+
+RATE = 16000
+BLOCK = 1600    # 0.1 s
+
+
+def _block(level: float, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    return (rng.standard_normal(BLOCK) * level * 32767).clip(-32768, 32767).astype(np.int16)
+
+
+def _calibrated_gate() -> VoiceActivityGate:
+    gate = VoiceActivityGate(sample_rate=RATE, pre_roll=0.3, hangover=0.4, flush_after=1.0,
+                             calibration_duration=0.5)
+    for i in range(5):
+        assert gate.feed(_block(0.001, i)) == gate.SILENCE
+    assert gate.calibrated
+    return gate
+
+
+def test_onset_carries_pre_roll():
+    gate = _calibrated_gate()
+    quiet = [_block(0.001, 10 + i) for i in range(5)]
+    for block in quiet:
+        gate.feed(block)
+    assert gate.feed(_block(0.3, 1)) == gate.ONSET
+    np.testing.assert_array_equal(gate.pre_roll(), np.concatenate(quiet[-3:]))
+
+
+def test_pause_between_hangover_and_flush_is_replayed():
+    gate = _calibrated_gate()
+    assert gate.feed(_block(0.3, 1)) == gate.ONSET
+    assert gate.feed(_block(0.3, 2)) == gate.SPEECH
+
+    # 0.7 s pause: hangover blocks pass through, the rest is held back
+    pause = [_block(0.001, 20 + i) for i in range(7)]
+    events = [gate.feed(block) for block in pause]
+    assert events == [gate.SPEECH] * 4 + [gate.SILENCE] * 3
+
+    # Resuming replays the held-back part of the pause, nothing is lost
+    assert gate.feed(_block(0.3, 3)) == gate.ONSET
+    np.testing.assert_array_equal(gate.pre_roll(), np.concatenate(pause[4:]))
+    assert gate.feed(_block(0.3, 4)) == gate.SPEECH
+
+
+def test_long_pause_ends_the_utterance():
+    gate = _calibrated_gate()
+    gate.feed(_block(0.3, 1))
+    events = [gate.feed(_block(0.001, 30 + i)) for i in range(12)]
+    assert events.count(gate.ENDPOINT) == 1
+    assert events[-1] == gate.SILENCE
+    assert gate.feed(_block(0.3, 2)) == gate.ONSET
+    assert len(gate.pre_roll()) == int(0.3 * RATE)
@@ -0,0 +1,108 @@
+# tests/test_zipstream.py
+import io
+import os
+import zipfile
+
+import pytest
+
+from aikeyboard import zipstream
+
+MEMBERS = {
+    "model/": b"",
+    "model/am/final.mdl": os.urandom(200_000),
+    "model/conf/model.conf": b"--sample-frequency=16000\n" * 50,
+    "model/README": b"small model\n",
+}
+
+
+class _Unseekable(io.RawIOBase):
+    """Write-only stream: zipfile puts sizes in data descriptors after each member."""
+
+    def __init__(self):
+        self.data = bytearray()
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self.data += b
+        return len(b)
+
+
+def _archive(compression, seekable=True, zip64=False) -> bytes:
+    out = io.BytesIO() if seekable else _Unseekable()
+    with zipfile.ZipFile(out, "w", compression) as archive:
+        for name, data in MEMBERS.items():
+            if name.endswith("/"):
+                archive.writestr(name, b"")
+                continue
+            info = zipfile.ZipInfo(name)
+            info.compress_type = compression
+            with archive.open(info, "w", force_zip64=zip64) as member:
+                member.write(data)
+    return bytes(out.getvalue() if seekable else out.data)
+
+
+def _read_at(data: bytes):
+    return lambda offset, size: data[offset:offset + size]
+
+
+def _check(dest, names=None):
+    for name, data in MEMBERS.items():
+        if name.endswith("/") or (names is not None and name not in names):
+            continue
+        assert (dest / name).read_bytes() == data, name
+
+
+@pytest.mark.parametrize("compression, seekable, zip64", [
+    (zipfile.ZIP_STORED, True, False),
+    (zipfile.ZIP_DEFLATED, True, False),
+    (zipfile.ZIP_DEFLATED, False, False),       # data descriptors
+    (zipfile.ZIP_STORED, True, True),
+    (zipfile.ZIP_DEFLATED, False, True),        # ZIP64 data descriptors
+])
+def test_extract(tmp_path, compression, seekable, zip64):
+    data = _archive(compression, seekable, zip64)
+    for info in zipfile.ZipFile(io.BytesIO(data)).infolist():
+        assert bool(info.flag_bits & 0x8) == (not seekable)
+    assert zipstream.extract(_read_at(data), tmp_path) == len(MEMBERS)
+    assert (tmp_path / "model").is_dir()
+    _check(tmp_path)
+
+
+def test_resume_from_offset(tmp_path):
+    data = _archive(zipfile.ZIP_DEFLATED, seekable=False)
+    offsets = []
+    zipstream.extract(_read_at(data), tmp_path / "all", member_done=offsets.append)
+    assert len(offsets) == len(MEMBERS)
+
+    # Nothing before the resume offset may be read again
+    def read_at(offset, size):
+        assert offset >= offsets[1]
+        return data[offset:offset + size]
+    assert zipstream.extract(read_at, tmp_path / "rest", offset=offsets[1]) == len(MEMBERS) - 2
+    assert not (tmp_path / "rest" / "model" / "am").exists()
+    _check(tmp_path / "rest", names=list(MEMBERS)[2:])
+
+
+def test_stored_with_descriptor_falls_back_to_central_directory(tmp_path):
+    data = _archive(zipfile.ZIP_STORED, seekable=False)
+    offsets = []
+    with pytest.raises(zipstream.NotStreamable) as raised:
+        zipstream.extract(_read_at(data), tmp_path, member_done=offsets.append)
+    assert offsets == [raised.value.offset]     # the directory entry streamed fine
+
+    def read_at(offset, size):
+        assert offset >= raised.value.offset
+        return data[offset:offset + size]
+    assert zipstream.extract_indexed(read_at, len(data), tmp_path, offset=raised.value.offset) == len(MEMBERS) - 1
+    _check(tmp_path)
+
+
+def test_refuses_paths_outside_destination(tmp_path):
+    out = io.BytesIO()
+    with zipfile.ZipFile(out, "w") as archive:
+        archive.writestr("../evil", b"x")
+    with pytest.raises(zipfile.BadZipFile):
+        zipstream.extract(_read_at(out.getvalue()), tmp_path / "dest")
+    assert not (tmp_path / "evil").exists()